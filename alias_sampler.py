@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# === Walker / Vose alias 表：建表 O(n)，每次抽樣 O(1)，記憶體只跟不同父代數量有關 ===
+class AliasSampler:
+    def __init__(self, weights):
+        w = np.asarray(weights, dtype=float)
+        if w.ndim != 1 or len(w) == 0:
+            raise ValueError("weights 必須是非空一維陣列")
+        if (w < 0).any() or not np.isfinite(w).all() or w.sum() <= 0:
+            raise ValueError("weights 必須為有限非負數且總和 > 0")
+        n = len(w)
+        self.n = n
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+
+        scaled = w * n / w.sum()
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩下的（含浮點誤差）機率視為 1
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return self.n
+
+    def draw(self, rng, size):
+        # 一次向量化抽 size 個索引
+        idx = rng.integers(self.n, size=size)
+        keep = rng.random(size) < self.prob[idx]
+        return np.where(keep, idx, self.alias[idx])
+
+    def probabilities(self):
+        # 由表還原各索引的抽中機率（檢查用）
+        p = self.prob / self.n
+        np.add.at(p, self.alias, (1.0 - self.prob) / self.n)
+        return p
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from backtest_engine import STRATEGY_TYPES, has_candles
+from state_io import atomic_write_json, read_json
+
+# === 分配設定 ===
+STATS_PATH = Path("~/Killcore/v3_allocation_stats.json").expanduser()
+TOTAL_BUDGET = 500          # 每代模組總數（與 v4 MODULE_COUNT 一致）
+METHOD = "thompson"         # "thompson" 或 "ucb"
+THOMPSON_DRAWS = 256        # 後驗抽樣次數，分配量 ∝ 各臂成為最佳的機率
+UCB_C = 1.0                 # UCB 探索係數
+UCB_STEP = 5                # UCB 每次分配的模組數（虛擬拉臂）
+EXPLORE_SHARE = 0.1         # 預留給全體臂平均分配的探索比例
+KING_BONUS = 5.0            # 每出一位王者額外加到 alpha
+DISCOUNT = 0.95             # 每代舊證據衰減，讓分配追得上行情變化
+
+# 關閉 bandit 或完全沒有歷史時的固定分配（舊版 MATIC / OP 常數）
+PRIOR_ALLOCATION = {
+    "MATICUSDT": {"A": 150, "C": 100},
+    "OPUSDT": {"B": 180, "C": 70},
+}
+DEFAULT_ALLOCATION = {"C": 100}
+
+def arm_key(symbol, strategy_type):
+    return f"{symbol}|{strategy_type}"
+
+def results_key(modules):
+    # 同一份 v5_result 只計入一次（evolve 已在記憶體計入、存檔後 v3 再讀到時略過）
+    h = hashlib.blake2b(digest_size=16)
+    for mod in modules:
+        h.update(str(mod.get("uid") or mod.get("id")).encode())
+    return h.hexdigest()
+
+def _new_arm():
+    return {"alpha": 1.0, "beta": 1.0, "pulls": 0, "kings": 0, "best_score": None, "last_seen": None}
+
+# === (symbol, strategy) 的 Beta 後驗統計 ===
+class AllocationStats:
+    def __init__(self, path=STATS_PATH):
+        self.path = Path(path)
+        data = read_json(self.path, default={}) or {}
+        self.arms = data.get("arms", {})
+        self.observed = data.get("observed")
+        self.rounds = data.get("rounds", 0)
+
+    def arm(self, symbol, strategy_type):
+        key = arm_key(symbol, strategy_type)
+        if key not in self.arms:
+            self.arms[key] = _new_arm()
+        return self.arms[key]
+
+    def observe(self, modules, discount=DISCOUNT):
+        # 獎勵 = 模組在該代的分數百分位（0~1），王者另加 KING_BONUS
+        # 只計入真的回測過的模組；沒有 K 線的隨機後備績效不是證據
+        scored = [
+            m for m in modules
+            if m.get("symbol") and isinstance(m.get("score"), (int, float)) and m.get("backtest_bars")
+            and m.get("backtested") is not False
+        ]
+        if not scored:
+            return False
+        key = results_key(modules)
+        if key == self.observed:
+            return False
+        for arm in self.arms.values():
+            arm["alpha"] = 1.0 + (arm["alpha"] - 1.0) * discount
+            arm["beta"] = 1.0 + (arm["beta"] - 1.0) * discount
+
+        scores = np.array([m["score"] for m in scored], dtype=float)
+        n = len(scores)
+        ranks = np.empty(n)
+        ranks[np.argsort(scores, kind="stable")] = np.arange(n)
+        rewards = ranks / (n - 1) if n > 1 else np.ones(1)
+        now = datetime.now().isoformat()
+        for mod, r in zip(scored, rewards.tolist()):
+            arm = self.arm(mod["symbol"], mod.get("strategy_type", "C"))
+            arm["alpha"] += r
+            arm["beta"] += 1.0 - r
+            arm["pulls"] += 1
+            if mod.get("is_king"):
+                arm["alpha"] += KING_BONUS
+                arm["kings"] += 1
+            if arm["best_score"] is None or mod["score"] > arm["best_score"]:
+                arm["best_score"] = mod["score"]
+            arm["last_seen"] = now
+        self.observed = key
+        self.rounds += 1
+        return True
+
+    def posterior(self, keys):
+        alpha = np.array([self.arms[k]["alpha"] if k in self.arms else 1.0 for k in keys])
+        beta = np.array([self.arms[k]["beta"] if k in self.arms else 1.0 for k in keys])
+        return alpha, beta
+
+    def credibility(self, symbols):
+        # 幣種信譽：各策略後驗合併後的平均獎勵 × 100，沒有資料的幣種為 50
+        score = {}
+        for sym in symbols:
+            arms = [self.arms[arm_key(sym, s)] for s in STRATEGY_TYPES if arm_key(sym, s) in self.arms]
+            a = sum(arm["alpha"] for arm in arms) - len(arms) + 1
+            b = sum(arm["beta"] for arm in arms) - len(arms) + 1
+            score[sym] = round(100 * a / (a + b), 2)
+        return score
+
+    def save(self):
+        atomic_write_json(self.path, {
+            "updated_at": datetime.now().isoformat(),
+            "rounds": self.rounds,
+            "observed": self.observed,
+            "arms": self.arms,
+        })
+
+# === 預算分配 ===
+def _largest_remainder(weights, budget):
+    weights = np.asarray(weights, dtype=float)
+    if budget <= 0 or weights.sum() <= 0:
+        return np.zeros(len(weights), dtype=int)
+    exact = weights / weights.sum() * budget
+    counts = np.floor(exact).astype(int)
+    rest = budget - counts.sum()
+    if rest:
+        counts[np.argsort(exact - counts, kind="stable")[::-1][:rest]] += 1
+    return counts
+
+def thompson_weights(alpha, beta, rng, draws=THOMPSON_DRAWS):
+    samples = rng.beta(alpha, beta, size=(draws, len(alpha)))
+    return np.bincount(samples.argmax(axis=1), minlength=len(alpha)) / draws
+
+def ucb_counts(alpha, beta, budget, c=UCB_C, step=UCB_STEP):
+    # 每次把 step 個模組給 UCB 最高的臂，並把它當作已拉過，再重算
+    mean = alpha / (alpha + beta)
+    pulls = alpha + beta - 2.0
+    counts = np.zeros(len(alpha), dtype=int)
+    total = max(1.0, pulls.sum())
+    given = 0
+    while given < budget:
+        n = pulls + counts
+        ucb = mean + c * np.sqrt(np.log(total + given + 1) / np.maximum(n, 1.0))
+        ucb[n == 0] = np.inf
+        i = int(np.argmax(ucb))
+        k = min(step, budget - given)
+        counts[i] += k
+        given += k
+    return counts
+
+def tradable_symbols(symbols):
+    # 沒有 K 線的幣種不給預算；全部都沒有時退回原清單（舊版隨機績效模式）
+    return [sym for sym in symbols if has_candles(sym)] or list(symbols)
+
+def allocate(symbols, stats=None, budget=TOTAL_BUDGET, method=METHOD, strategies=STRATEGY_TYPES, seed=None):
+    stats = stats if stats is not None else AllocationStats()
+    symbols = tradable_symbols(symbols)
+    keys = [(sym, s) for sym in symbols for s in strategies]
+    if not keys:
+        return {}
+    alpha, beta = stats.posterior([arm_key(*k) for k in keys])
+
+    rng = np.random.default_rng(seed)
+    # 探索份額隨機撒給各臂（臂數多於份額時不會永遠落在清單前段）
+    n_explore = int(round(budget * EXPLORE_SHARE))
+    explore = np.bincount(rng.integers(len(keys), size=n_explore), minlength=len(keys))
+    exploit_budget = budget - n_explore
+    if method == "ucb":
+        counts = ucb_counts(alpha, beta, exploit_budget)
+    else:
+        counts = _largest_remainder(thompson_weights(alpha, beta, rng), exploit_budget)
+    counts = counts + explore
+    return {k: int(c) for k, c in zip(keys, counts.tolist()) if c > 0}
+
+def fixed_allocation(symbols):
+    return {
+        (sym, s): count
+        for sym in symbols
+        for s, count in PRIOR_ALLOCATION.get(sym, DEFAULT_ALLOCATION).items()
+    }
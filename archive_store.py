@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from lineage_store import module_uid
+
+# === 檔案路徑 / 保留設定 ===
+ARCHIVE_DB_PATH = Path("~/Killcore/v4_archive.db").expanduser()
+LEGACY_ARCHIVE_PATH = Path("~/Killcore/v4_archive.json").expanduser()
+KEEP_GENERATIONS = 20        # 只保留最近 N 代；None = 不淘汰
+RESURRECT_LIMIT = 100        # 復活池上限（同 build_parent_pools）
+RESURRECT_SCORE = 75
+L2_SCORE = 85
+L2_GENERATION = 3
+UNSTABLE_TYPE = "爆倉型"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    uid TEXT PRIMARY KEY,
+    generation INTEGER,
+    id TEXT,
+    symbol TEXT,
+    strategy_type TEXT,
+    score REAL,
+    eliminated INTEGER,
+    type TEXT,
+    mutate_generation INTEGER,
+    archived_at TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_archive_generation ON archive(generation);
+CREATE INDEX IF NOT EXISTS idx_archive_eliminated_score ON archive(eliminated, score);
+CREATE INDEX IF NOT EXISTS idx_archive_score ON archive(score);
+CREATE INDEX IF NOT EXISTS idx_archive_mutate_generation ON archive(mutate_generation);
+CREATE INDEX IF NOT EXISTS idx_archive_type ON archive(type);
+CREATE INDEX IF NOT EXISTS idx_archive_symbol ON archive(symbol, strategy_type);
+"""
+
+class ArchiveStore:
+    # 取代整檔 v4_archive.json：每代一批寫入，父代池改成走索引的範圍查詢，只取需要的列
+    def __init__(self, path=ARCHIVE_DB_PATH, keep_generations=KEEP_GENERATIONS, legacy_path=LEGACY_ARCHIVE_PATH):
+        self.path = Path(path)
+        self.keep_generations = keep_generations
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        if legacy_path is not None:
+            self._migrate(Path(legacy_path))
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def _migrate(self, legacy_path):
+        # 舊版整檔 JSON list → 第 0 代（只做一次）
+        if len(self) or not legacy_path.exists():
+            return
+        with legacy_path.open() as f:
+            modules = json.load(f)
+        self.append(modules, generation=0)
+        legacy_path.rename(legacy_path.with_name(legacy_path.name + ".migrated"))
+        print(f"[archive] 已轉換 {legacy_path.name} → {self.path.name}（{len(modules)} 筆）")
+
+    # === 寫入 / 保留 ===
+    def latest_generation(self):
+        return self.conn.execute("SELECT MAX(generation) FROM archive").fetchone()[0]
+
+    def append(self, modules, generation=None):
+        if generation is None:
+            generation = (self.latest_generation() or 0) + 1
+        now = datetime.now().isoformat()
+        modules = [m for m in modules if m.get("backtested") is not False]   # 隨機後備績效不進父代池
+        rows = [
+            (module_uid(m), generation, m.get("id"), m.get("symbol"), m.get("strategy_type"), m.get("score", 0),
+             int(bool(m.get("eliminated"))), m.get("type"), m.get("mutate_generation", 0), now, json.dumps(m))
+            for m in modules
+        ]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO archive VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+        self.apply_retention()
+        return generation
+
+    def apply_retention(self):
+        if not self.keep_generations:
+            return 0
+        latest = self.latest_generation()
+        if latest is None:
+            return 0
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM archive WHERE generation <= ?", (latest - self.keep_generations,))
+        return cur.rowcount
+
+    # === 查詢 ===
+    def _modules(self, where, params=(), order="", limit=None):
+        sql = f"SELECT data FROM archive WHERE {where} {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [json.loads(r[0]) for r in self.conn.execute(sql, params)]
+
+    def resurrection_candidates(self, limit=RESURRECT_LIMIT):
+        # 被淘汰但分數高於門檻：依分數取前 limit 名
+        return self._modules("eliminated = 1 AND score > ?", (RESURRECT_SCORE,), "ORDER BY score DESC", limit)
+
+    def parent_pools(self, resurrect_limit=RESURRECT_LIMIT):
+        # 回傳 (復活者, L2, L1 一般)；分類規則同 build_parent_pools，復活名額給分數最高者
+        resurrect = self.resurrection_candidates(resurrect_limit)
+        taken = {module_uid(m) for m in resurrect}
+        l2 = [m for m in self._modules("score > ? OR mutate_generation >= ?", (L2_SCORE, L2_GENERATION))
+              if module_uid(m) not in taken]
+        l1 = [m for m in self._modules(
+            "score <= ? AND mutate_generation < ? AND (type IS NULL OR type != ?)",
+            (L2_SCORE, L2_GENERATION, UNSTABLE_TYPE),
+        ) if module_uid(m) not in taken]
+        return resurrect, l2, l1
+
+    def stats(self):
+        row = self.conn.execute("SELECT COUNT(*), MIN(generation), MAX(generation) FROM archive").fetchone()
+        return {"modules": row[0], "oldest_generation": row[1], "latest_generation": row[2]}
+
+_STORES = {}
+
+def get_store(path=ARCHIVE_DB_PATH):
+    path = Path(path)
+    if path not in _STORES:
+        _STORES[path] = ArchiveStore(path)
+    return _STORES[path]
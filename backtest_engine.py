@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from pathlib import Path
+
+from fitness_cache import FitnessCache, fitness_keys, quantize_columns, quantize_costs, window_hash
+from indicator_cache import INDICATOR_CACHE, rolling_mean
+
+# === 回測設定 ===
+CANDLE_PATH = Path("~/Killcore/candles").expanduser()
+TIMEFRAME = "1h"
+BACKTEST_BARS = 5000          # 每個幣種只取最近 N 根 K 線
+BARS_PER_YEAR = 24 * 365      # Sharpe 年化用（對應 1h）
+VIRTUAL_CAPITAL = 1000.0
+STRATEGY_TYPES = ("A", "B", "C")
+ENABLE_FITNESS_CACHE = True   # 相同 (symbol, strategy, 量化參數, K 線區間) 直接取回舊結果
+CHUNK_ELEMS = 2_000_000       # 每次批次回測的 (模組 × K 線) 上限；5000 根 K 線 → 每塊 400 模組，峰值記憶體與總模組數無關
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+OHLCV_COLUMNS = ("open", "high", "low", "close", "volume")
+
+_CANDLES = {}
+_PROVIDER = None
+
+def set_candle_provider(provider):
+    # provider(symbol, timeframe) → OHLCV 或 None；例如 market_stream 的共享環形緩衝
+    global _PROVIDER
+    _PROVIDER = provider
+
+# === K 線讀取（CSV / Parquet）===
+def _candle_files(symbol, timeframe):
+    for name in (f"{symbol}_{timeframe}", symbol):
+        for ext in (".parquet", ".csv"):
+            path = CANDLE_PATH / f"{name}{ext}"
+            if path.exists():
+                yield path
+
+def _read_csv(path):
+    raw = np.genfromtxt(path, delimiter=",", names=True, dtype=float, encoding="utf-8")
+    names = {n.lower(): n for n in raw.dtype.names}
+    return np.column_stack([raw[names[c]] for c in OHLCV_COLUMNS])
+
+def _read_parquet(path):
+    try:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        names = {n.lower(): n for n in table.column_names}
+        return np.column_stack([table.column(names[c]).to_numpy() for c in OHLCV_COLUMNS]).astype(float)
+    except ImportError:
+        pass
+    try:
+        import pandas as pd
+    except ImportError:
+        print(f"[bt] 無 pyarrow / pandas，略過 {path.name}")
+        return None
+    df = pd.read_parquet(path)
+    df.columns = [c.lower() for c in df.columns]
+    return df[list(OHLCV_COLUMNS)].to_numpy(dtype=float)
+
+def load_candles(symbol, timeframe=TIMEFRAME):
+    if _PROVIDER is not None:
+        live = _PROVIDER(symbol, timeframe)
+        if live is not None:
+            return live
+    key = (symbol, timeframe)
+    if key in _CANDLES:
+        return _CANDLES[key]
+    ohlcv = None
+    for path in _candle_files(symbol, timeframe):
+        ohlcv = _read_parquet(path) if path.suffix == ".parquet" else _read_csv(path)
+        if ohlcv is not None:
+            break
+    if ohlcv is not None:
+        ohlcv = np.ascontiguousarray(ohlcv[-BACKTEST_BARS:], dtype=float)
+    _CANDLES[key] = ohlcv
+    return ohlcv
+
+def has_candles(symbol, timeframe=TIMEFRAME):
+    # 只看有沒有資料來源（不讀檔）；v3 分配預算時用，沒有 K 線的幣種無法回測
+    key = (symbol, timeframe)
+    if _PROVIDER is not None or key in _CANDLES:
+        ohlcv = load_candles(symbol, timeframe)
+        return ohlcv is not None and len(ohlcv) >= 2
+    return next(_candle_files(symbol, timeframe), None) is not None
+
+# === 指標 ===
+def _hold_state(enter, leave):
+    # enter / leave 事件向前填補成持倉狀態（無逐 K 迴圈）
+    events = np.where(enter, 1, np.where(leave, 0, -1)).astype(np.int8)
+    t = np.arange(events.shape[1])
+    last = np.maximum.accumulate(np.where(events >= 0, t, 0), axis=1)
+    return np.take_along_axis(events, last, axis=1) == 1
+
+# === 策略訊號 ===
+def _signals(strategy_type, close, fast, slow, sl):
+    with np.errstate(invalid="ignore"):
+        if strategy_type == "A":      # 雙均線突破
+            return _hold_state(fast > slow, fast <= slow)
+        if strategy_type == "B":      # 區間反轉：跌破下軌進場，回到慢線出場
+            return _hold_state(close < slow * (1 - sl[:, None] / 100), close >= slow)
+        # C 穩定 scalping：順勢回踩快線
+        return _hold_state((close > fast) & (fast > slow), close < fast)
+
+def _apply_stops(pos, close, sl, tp):
+    t = np.arange(pos.shape[1])
+    prev = np.zeros_like(pos)
+    prev[:, 1:] = pos[:, :-1]
+    entry_idx = np.maximum.accumulate(np.where(pos & ~prev, t, 0), axis=1)
+    move = close[None, :] / close[entry_idx] - 1
+    hit = pos & ((move <= -sl[:, None] / 100) | (move >= tp[:, None] / 100))
+    last_hit = np.maximum.accumulate(np.where(hit, t, -1), axis=1)
+    # 觸發停損/停利的那根 K 收盤出場，直到下一次進場訊號前不再持倉
+    return pos & (last_hit < entry_idx)
+
+# === 批次回測 ===
+def position_returns(ohlcv, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct=0.0, slippage_pct=0.0,
+                     cache_key=None, cache=INDICATOR_CACHE):
+    # 回傳 (pos, held, gross, net)，皆為 (modules × bars)；walk-forward 直接切片使用
+    close = ohlcv[:, CLOSE]
+    n_mod, n_bar = len(strategy_types), len(close)
+    strategy_types = np.asarray(strategy_types)
+    sl = np.asarray(sl_pct, dtype=float)
+    tp = np.asarray(tp_pct, dtype=float)
+
+    if cache_key is not None and cache is not None:
+        fast = cache.rolling_means(*cache_key, close, ma_fast)
+        slow = cache.rolling_means(*cache_key, close, ma_slow)
+    else:
+        fast = rolling_mean(close, ma_fast)
+        slow = rolling_mean(close, ma_slow)
+    pos = np.zeros((n_mod, n_bar), dtype=bool)
+    for strat in np.unique(strategy_types):
+        rows = np.flatnonzero(strategy_types == strat)
+        pos[rows] = _signals(strat, close, fast[rows], slow[rows], sl[rows])
+    pos = _apply_stops(pos, close, sl, tp)
+
+    held = np.zeros_like(pos)
+    held[:, 1:] = pos[:, :-1]
+    bar_ret = np.zeros(n_bar)
+    bar_ret[1:] = close[1:] / close[:-1] - 1
+    cost = np.broadcast_to(np.asarray(fee_pct, dtype=float) + np.abs(np.asarray(slippage_pct, dtype=float)), (n_mod,))
+    gross = held * bar_ret[None, :]
+    net = gross - (pos != held) * cost[:, None]
+    return pos, held, gross, net
+
+def backtest_batch(ohlcv, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct=0.0, slippage_pct=0.0,
+                   cache_key=None, cache=INDICATOR_CACHE):
+    close = ohlcv[:, CLOSE]
+    n_mod, n_bar = len(strategy_types), len(close)
+    pos, held, gross, net = position_returns(ohlcv, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct,
+                                             slippage_pct, cache_key, cache)
+
+    equity = np.cumprod(1 + net, axis=1)
+    gross_equity = np.cumprod(1 + gross, axis=1)
+    drawdown = (1 - equity / np.maximum.accumulate(equity, axis=1)).max(axis=1)
+    std = net.std(axis=1)
+    sharpe = np.divide(net.mean(axis=1), std, out=np.zeros(n_mod), where=std > 0) * np.sqrt(BARS_PER_YEAR)
+
+    entries = pos & ~held
+    trade_count = entries.sum(axis=1)
+    trade_id = np.cumsum(entries, axis=1)
+    owner = np.where(pos | held, trade_id, 0)
+    max_trades = int(trade_count.max()) + 1 if n_mod else 1
+    keys = (np.arange(n_mod)[:, None] * max_trades + owner).ravel()
+    trade_pnl = np.bincount(keys, weights=np.log1p(net).ravel(), minlength=n_mod * max_trades)
+    trade_pnl = trade_pnl.reshape(n_mod, max_trades)[:, 1:]
+    wins = ((trade_pnl > 0) & (np.arange(1, max_trades)[None, :] <= trade_count[:, None])).sum(axis=1)
+    win_rate = np.divide(wins, trade_count, out=np.zeros(n_mod), where=trade_count > 0)
+
+    t = np.arange(n_bar)
+    exits = held & ~pos
+    first_entry = np.where(entries.any(axis=1), entries.argmax(axis=1), n_bar - 1)
+    last_exit = np.where(exits, t, -1).max(axis=1)
+    last_exit = np.where(pos[:, -1] | (last_exit < 0), n_bar - 1, last_exit)
+
+    return {
+        "return_pct": (gross_equity[:, -1] - 1) * 100,
+        "adjusted_return_pct": (equity[:, -1] - 1) * 100,
+        "sharpe": sharpe,
+        "win_rate": win_rate * 100,
+        "drawdown": drawdown * 100,
+        "trade_count": trade_count,
+        "entry_price": close[first_entry],
+        "exit_price": close[last_exit],
+    }
+
+def _param_columns(modules):
+    params = [m.get("parameters", {}) for m in modules]
+    return (
+        [m.get("strategy_type", "C") for m in modules],
+        [int(p.get("ma_fast", 10)) for p in params],
+        [int(p.get("ma_slow", 30)) for p in params],
+        [float(p.get("sl_pct", 1.5)) for p in params],
+        [float(p.get("tp_pct", 3.0)) for p in params],
+    )
+
+# === 結果欄位（可直接放進共享記憶體）===
+RESULT_DTYPE = np.dtype([
+    ("evaluated", "?"), ("return_pct", "<f8"), ("adjusted_return_pct", "<f8"), ("sharpe", "<f8"),
+    ("win_rate", "<f8"), ("drawdown", "<f8"), ("trade_count", "<i8"), ("entry_price", "<f8"),
+    ("exit_price", "<f8"), ("backtest_bars", "<i8"),
+])
+
+FITNESS_CACHE = FitnessCache(RESULT_DTYPE)
+
+def chunk_bounds(n_mod, n_bar, max_elems=None):
+    # 把 n_mod 列切成每塊至多 max_elems / n_bar 列的 (lo, hi)
+    step = max(1, (max_elems or CHUNK_ELEMS) // max(1, n_bar))
+    return [(lo, min(lo + step, n_mod)) for lo in range(0, n_mod, step)]
+
+def _backtest_rows(ohlcv, columns, fee, slip, cache_key):
+    # (modules × bars) 的中間矩陣只在每一塊內存在，結果列逐塊寫入
+    rows = np.zeros(len(columns[0]), dtype=RESULT_DTYPE)
+    for lo, hi in chunk_bounds(len(rows), len(ohlcv)):
+        res = backtest_batch(ohlcv, *[c[lo:hi] for c in columns], fee_pct=_slice(fee, lo, hi),
+                             slippage_pct=_slice(slip, lo, hi), cache_key=cache_key)
+        for k, v in res.items():
+            rows[k][lo:hi] = v
+    rows["backtest_bars"] = len(ohlcv)
+    rows["evaluated"] = True
+    return rows
+
+def _take(values, idx):
+    # 欄位可能是逐模組清單，也可能是純量（無成本時的 0.0）
+    return [values[i] for i in idx] if isinstance(values, list) else values
+
+def _slice(values, lo, hi):
+    return values[lo:hi] if isinstance(values, list) else values
+
+def evaluate_into(modules, out, timeframe=TIMEFRAME, with_costs=False, cache=None):
+    # 依幣種分組，同一幣種整代模組共用一份 K 線一次算完，結果逐列寫入 out
+    # 命中適應度快取的模組不重跑回測
+    if cache is None and ENABLE_FITNESS_CACHE:
+        cache = FITNESS_CACHE
+    groups = {}
+    for i, mod in enumerate(modules):
+        groups.setdefault(mod.get("symbol"), []).append(i)
+
+    out["evaluated"] = False
+    for symbol, rows in groups.items():
+        ohlcv = load_candles(symbol, timeframe)
+        if ohlcv is None or len(ohlcv) < 2:
+            continue
+        mods = [modules[i] for i in rows]
+        fee = [m.get("tx_fee_pct", 0.001) for m in mods] if with_costs else 0.0
+        slip = [m.get("slippage_pct", 0.0) for m in mods] if with_costs else 0.0
+        columns = _param_columns(mods)
+        rows = np.asarray(rows)
+        if cache is None:
+            out[rows] = _backtest_rows(ohlcv, columns, fee, slip, (symbol, timeframe))
+            continue
+
+        columns = quantize_columns(*columns)
+        fee, slip = quantize_costs(fee), quantize_costs(slip)
+        window = window_hash(ohlcv)
+        cache.invalidate_window(symbol, timeframe, window)
+        keys = fitness_keys(symbol, timeframe, window, *columns, fee, slip)
+        found, cached = cache.get_many(keys)
+        miss = np.flatnonzero(~found)
+        if len(miss):
+            fresh = _backtest_rows(ohlcv, [_take(c, miss) for c in columns], _take(fee, miss), _take(slip, miss),
+                                   (symbol, timeframe))
+            cached[miss] = fresh
+            uniq = {}
+            for j, i in enumerate(miss.tolist()):
+                uniq.setdefault(keys[i], j)
+            cache.put_many(symbol, timeframe, window, list(uniq), fresh[list(uniq.values())])
+        out[rows] = cached
+    return out
+
+def apply_results(modules, results):
+    # 回傳沒有 K 線、未被評估的模組
+    missing = []
+    for mod, row in zip(modules, results):
+        mod["backtested"] = bool(row["evaluated"])
+        if not row["evaluated"]:
+            missing.append(mod)
+            continue
+        mod["return_pct"] = round(float(row["return_pct"]), 2)
+        mod["adjusted_return_pct"] = round(float(row["adjusted_return_pct"]), 2)
+        mod["sharpe"] = round(float(row["sharpe"]), 2)
+        mod["win_rate"] = round(float(row["win_rate"]), 1)
+        mod["drawdown"] = round(float(row["drawdown"]), 1)
+        mod["trade_count"] = int(row["trade_count"])
+        mod["entry_price"] = round(float(row["entry_price"]), 4)
+        mod["exit_price"] = round(float(row["exit_price"]), 4)
+        mod["net_profit"] = round(mod["adjusted_return_pct"] / 100 * VIRTUAL_CAPITAL, 2)
+        mod["backtest_bars"] = int(row["backtest_bars"])
+    return missing
+
+def is_backtested(mod):
+    # 沒有 K 線、績效是後備隨機數的模組（backtested=False）不可與真回測同場排名
+    return mod.get("backtested") is not False
+
+def modules_without_candles(modules, timeframe=TIMEFRAME):
+    # 不回測，只找出沒有 K 線（會被 evaluate_modules 回傳為 missing）的模組
+    ok = {}
+    for mod in modules:
+        symbol = mod.get("symbol")
+        if symbol not in ok:
+            ohlcv = load_candles(symbol, timeframe)
+            ok[symbol] = ohlcv is not None and len(ohlcv) >= 2
+    return [mod for mod in modules if not ok[mod.get("symbol")]]
+
+def evaluate_modules(modules, timeframe=TIMEFRAME, with_costs=False):
+    results = evaluate_into(modules, np.zeros(len(modules), dtype=RESULT_DTYPE), timeframe, with_costs)
+    return apply_results(modules, results)
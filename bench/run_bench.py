@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# === 基準測試設定 ===
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+LAST_RUN_PATH = Path("~/Killcore/bench/last_run.json").expanduser()   # 每次結果寫在源碼樹外
+SIZES = (500, 10000, 100000)
+REGRESSION_PCT = 20.0      # ops/sec 比基準低超過此比例視為退步
+FIXTURE_BARS = 1000        # 合成 K 線根數
+FIXTURE_SYMBOLS = ("ETHUSDT", "BTCUSDT")
+PARENT_POOL = 500          # 突變 / 生成案例的父代池大小
+
+# 每個案例：(說明, 規模上限)；超過上限的規模略過（None = 不設限）
+CASES = {
+    "mutate_parameters": ("v4 逐筆突變", None),
+    "mutate_parameters_batch": ("v4 整批突變", None),
+    "generate_module": ("v4 逐筆生成", None),
+    "generate_stage": ("v4 整批生成", None),
+    "simulate_trade": ("v5 滑點 / 手續費", None),
+    "v5_scoring": ("v5 計分 + 加冕 + 分類", None),
+    "backtest": ("回測引擎（合成 K 線）", None),
+    "insert_into_king_pool": ("v1 逐筆寫入王者池", None),
+    "king_pool_insert_many": ("王者池整批寫入", None),
+    "write_generation": ("v4 世代存檔", None),
+}
+
+# === 合成資料 ===
+def make_parents(n, rng):
+    return [
+        {
+            "id": f"p-{i}",
+            "uid": f"p{i:08d}",
+            "symbol": FIXTURE_SYMBOLS[i % len(FIXTURE_SYMBOLS)],
+            "strategy_type": "ABC"[i % 3],
+            "parameters": {
+                "ma_fast": rng.randint(3, 20),
+                "ma_slow": rng.randint(25, 120),
+                "sl_pct": round(rng.uniform(0.5, 3.0), 4),
+                "tp_pct": round(rng.uniform(1.0, 8.0), 4),
+            },
+            "mutate_generation": rng.randint(0, 5),
+            "is_divine": i % 97 == 0,
+            "resurrected": i % 13 == 0,
+            "king_rounds": rng.randint(1, 5),
+        }
+        for i in range(n)
+    ]
+
+def make_modules(n, rng, symbol=None):
+    mods = make_parents(n, rng)
+    for mod in mods:
+        if symbol:
+            mod["symbol"] = symbol
+        mod.update({
+            "return_pct": round(rng.uniform(-5, 10), 2),
+            "adjusted_return_pct": round(rng.uniform(-6, 9), 2),
+            "sharpe": round(rng.uniform(-1, 3), 2),
+            "win_rate": round(rng.uniform(20, 80), 1),
+            "drawdown": round(rng.uniform(0.5, 30), 1),
+            "trade_count": rng.randint(0, 50),
+            "net_profit": round(rng.uniform(-200, 200), 2),
+            "entry_price": 1000.0,
+            "exit_price": round(rng.uniform(900, 1100), 4),
+            "backtest_bars": FIXTURE_BARS,
+            "score": round(rng.uniform(-100, 100), 2),
+        })
+    return mods
+
+def write_candles(home, rng):
+    path = Path(home) / "Killcore" / "candles"
+    path.mkdir(parents=True, exist_ok=True)
+    for symbol in FIXTURE_SYMBOLS:
+        price = 1000.0
+        lines = ["timestamp,open,high,low,close,volume"]
+        for t in range(FIXTURE_BARS):
+            o = price
+            price = max(1.0, price * (1 + rng.gauss(0, 0.01)))
+            lines.append(f"{t * 3600},{o:.4f},{max(o, price) * 1.002:.4f},{min(o, price) * 0.998:.4f},"
+                         f"{price:.4f},{rng.uniform(10, 1000):.2f}")
+        (path / f"{symbol}_1h.csv").write_text("\n".join(lines) + "\n")
+
+# === 各案例：回傳 (計時函式, 處理筆數) ===
+def setup_case(name, n, home):
+    rng = random.Random(42)
+    import v4_generator
+    v4_generator.seed_rng(42)
+
+    # 父代池固定 PARENT_POOL 筆，n 個子代從中抽（與 v4 實際情況相同）
+    parents = make_parents(min(n, PARENT_POOL), rng)
+    draws = [rng.randrange(len(parents)) for _ in range(n)]
+
+    if name == "mutate_parameters":
+        return lambda: [v4_generator.mutate_parameters(parents[i]["parameters"], parents[i]["resurrected"],
+                                                       parents[i]["is_divine"]) for i in draws], n
+
+    if name == "mutate_parameters_batch":
+        params = [p["parameters"] for p in parents]
+        boost = [parents[i]["resurrected"] for i in draws]
+        divine = [parents[i]["is_divine"] for i in draws]
+        return lambda: v4_generator.mutate_parameters_batch(params, draws, boost, divine), n
+
+    if name == "generate_module":
+        return lambda: [v4_generator.generate_module(parents[i], j, list(FIXTURE_SYMBOLS))
+                        for j, i in enumerate(draws)], n
+
+    if name == "generate_stage":
+        return lambda: v4_generator.generate_stage(parents, 0, n, list(FIXTURE_SYMBOLS), "L1"), n
+
+    if name == "simulate_trade":
+        import v5_verifier
+        mods = make_modules(n, rng)
+        for mod in mods:
+            # 沒有 backtest_bars 才會走完滑點 / 手續費 / 淨利的計算（有回測的模組會提早返回）
+            del mod["backtest_bars"]
+        return lambda: [v5_verifier.simulate_trade(m) for m in mods], n
+
+    if name == "v5_scoring":
+        import v5_verifier
+        v5_verifier.ENABLE_PARALLEL_VERIFY = False
+        v5_verifier.ENABLE_LINEAGE_STORE = False
+        # 沒有 K 線的幣種：回測直接略過，只量 v5 本身的計分 / 加冕 / 分類
+        mods = make_modules(n, rng, symbol="NOCANDLE")
+        for m in mods:
+            v5_verifier.prepare_module(m, 0)
+
+        def run():
+            v5_verifier.evaluate_generation(mods)
+            ranked, _, _, _ = v5_verifier.crown_king(mods, [])
+            v5_verifier.classify_modules(ranked)
+        return run, n
+
+    if name == "backtest":
+        import backtest_engine
+        write_candles(home, rng)
+        backtest_engine.ENABLE_FITNESS_CACHE = False
+        mods = make_modules(n, rng)
+        return lambda: backtest_engine.evaluate_modules(mods), n
+
+    if name == "insert_into_king_pool":
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("v1_insert_king", ROOT / "v1 insert_king.py")
+        v1 = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(v1)
+        kings = make_modules(n, rng)
+        path = Path(home) / "Killcore" / "king_pool.json"
+        return lambda: [v1.insert_into_king_pool(path, k) for k in kings], n
+
+    if name == "king_pool_insert_many":
+        from king_pool import KingPool
+        kings = make_modules(n, rng)
+        pool = KingPool(Path(home) / "Killcore" / "king_pool.json")
+        return lambda: pool.insert_many(kings), n
+
+    if name == "write_generation":
+        import generation_store
+        mods = make_modules(n, rng)
+        return lambda: generation_store.write_generation(copy.deepcopy(mods)), n
+
+    raise ValueError(f"未知案例：{name}")
+
+def _disk_usage(path):
+    sizes = {}
+    for dirpath, _, files in os.walk(path):
+        for f in files:
+            p = os.path.join(dirpath, f)
+            try:
+                sizes[p] = os.path.getsize(p)
+            except OSError:
+                pass
+    return sizes
+
+def run_case(name, n, home):
+    # 子進程內執行：HOME 已指向暫存目錄，Killcore 模組的路徑常數在 import 時展開
+    sys.path.insert(0, str(ROOT))
+    Path(home, "Killcore").mkdir(parents=True, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn, ops = setup_case(name, n, home)
+        before = _disk_usage(home)
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    after = _disk_usage(home)
+    written = sum(max(0, size - before.get(p, 0)) for p, size in after.items())
+    return {
+        "case": name,
+        "size": n,
+        "elapsed_sec": round(elapsed, 6),
+        "ops_per_sec": round(ops / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "bytes_written": written,
+    }
+
+def spawn_case(name, n):
+    # 每個 (案例, 規模) 一個新進程 + 新的暫存 ~/Killcore，peak RSS 與寫入量互不干擾
+    with tempfile.TemporaryDirectory(prefix="killcore-bench-") as home:
+        env = dict(os.environ, HOME=home, KILLCORE_RUN_SEED="0")
+        proc = subprocess.run(
+            [sys.executable, __file__, "--case", name, "--size", str(n), "--home", home],
+            env=env, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        return {"case": name, "size": n, "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# === 基準比較 ===
+def compare(results, baseline):
+    base = {(r["case"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        ref = base.get((r["case"], r["size"]))
+        if not ref or not ref.get("ops_per_sec") or not r.get("ops_per_sec"):
+            continue
+        change = (r["ops_per_sec"] / ref["ops_per_sec"] - 1) * 100
+        r["vs_baseline_pct"] = round(change, 1)
+        if change < -REGRESSION_PCT:
+            regressions.append(r)
+    return regressions
+
+def print_table(results):
+    print(f"{'case':<26}{'size':>8}{'ops/sec':>14}{'peak MB':>10}{'written':>12}{'vs base':>10}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<26}{r['size']:>8}  錯誤：{r['error']}")
+            continue
+        if r.get("skipped"):
+            print(f"{r['case']:<26}{r['size']:>8}  略過（超過規模上限）")
+            continue
+        delta = f"{r['vs_baseline_pct']:+.1f}%" if "vs_baseline_pct" in r else "-"
+        print(f"{r['case']:<26}{r['size']:>8}{r['ops_per_sec']:>14,.0f}{r['peak_rss_mb']:>10}"
+              f"{r['bytes_written']:>12,}{delta:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Killcore 基準測試（生成 / 驗證 / 王者池）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="把本次結果存成新的基準")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--home", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.size, args.home)))
+        return 0
+
+    results = []
+    for name in args.cases:
+        limit = CASES[name][1]
+        for n in args.sizes:
+            if limit and n > limit:
+                results.append({"case": name, "size": n, "skipped": True})
+                continue
+            print(f"[bench] {name} × {n} ...", flush=True)
+            results.append(spawn_case(name, n))
+
+    regressions = []
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()))
+    print_table(results)
+
+    run = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    LAST_RUN_PATH.parent.mkdir(parents=True, exist_ok=True)
+    LAST_RUN_PATH.write_text(json.dumps(run, indent=2))
+    print(f"[bench] 本次結果：{LAST_RUN_PATH}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2))
+        print(f"[bench] 基準已寫入 {args.baseline}")
+    for r in regressions:
+        print(f"[bench] 退步：{r['case']} × {r['size']}（{r['vs_baseline_pct']:+.1f}%）")
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
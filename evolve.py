@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import argparse
+import random
+import signal
+import time
+
+import allocation_engine
+import archive_store
+import backtest_engine
+import generation_store
+import lineage_store
+import market_stream
+import metrics
+import v3_controller
+import v4_generator
+import v5_verifier
+from king_pool import KingPool
+from ranking import Leaderboard
+from state_io import atomic_write_json
+
+# === 演化迴圈設定 ===
+GENERATIONS = 100
+CHECKPOINT_EVERY = 50   # 每 K 代落地一次（SIGTERM 時也會）
+V4_BACKTEST = False     # v5 會以含成本回測覆寫 v4 的無成本績效，演化迴圈內略過 v4 回測
+DEFER_WRITES = True     # lineage.db / fitness_cache.db 的寫入先留在記憶體，存檔時一次落地
+PROGRESS_EVERY = 10
+
+_stop_requested = False
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+    print(f"[evolve] 收到訊號 {signum}，本代結束後存檔並停止")
+
+def load_state():
+    king_pool = KingPool(v5_verifier.KING_PATH)
+    godline = v5_verifier.load_godline()
+    previous_modules = v4_generator.load_json_list(v5_verifier.RESULT_PATH)
+    return king_pool, godline, previous_modules
+
+def load_assignments():
+    assignments = v3_controller.process_symbol_pool()
+    symbols = sorted({a["symbol"] for a in assignments})
+    return assignments, symbols or v4_generator.load_symbols()
+
+def checkpoint(king_pool, new_kings, modules, report, alloc_stats, leaderboard, generation):
+    with metrics.span("checkpoint"):
+        _checkpoint(king_pool, new_kings, modules, report, alloc_stats, leaderboard, generation)
+
+def defer_writes(enabled):
+    lineage_store.get_store().defer_writes(enabled)
+    backtest_engine.FITNESS_CACHE.defer_writes(enabled)
+
+def _checkpoint(king_pool, new_kings, modules, report, alloc_stats, leaderboard, generation):
+    generation = v4_generator.save_generation(modules, report, generation)
+    with metrics.span("flush"):
+        lineage_store.get_store().flush()
+        backtest_engine.FITNESS_CACHE.flush()
+    atomic_write_json(v5_verifier.RESULT_PATH, modules)
+    if v5_verifier.ENABLE_ARCHIVE:
+        archive_store.get_store().append(modules, generation=generation)
+    alloc_stats.save()
+    leaderboard.save()
+    king_pool.compact()
+    v5_verifier.godline_log().extend(new_kings)
+    print(f"[evolve] 存檔完成：第 {generation} 代（王者 {new_kings[-1]['id']}）")
+    new_kings.clear()
+
+def evolve(generations=GENERATIONS, checkpoint_every=CHECKPOINT_EVERY, seed=None, replay=False):
+    # v3 → v4 → v5 全程在同一個進程內循環，王者池 / godline / 上一代模組都留在記憶體
+    global _stop_requested
+    _stop_requested = False
+    previous_handler = signal.signal(signal.SIGTERM, _request_stop)
+    if DEFER_WRITES:
+        defer_writes(True)
+    if seed is not None:
+        random.seed(seed)
+        v4_generator.seed_rng(seed)
+
+    assignments, symbols = load_assignments()
+    if replay:
+        # 回測改讀串流環形緩衝中的 K 線
+        stream, _ = market_stream.replay_and_rank()
+        print(f"[evolve] 串流重播 {stream.messages} 筆訊息，共享 {len(stream.buffers)} 幣種 K 線")
+    king_pool, godline, previous_modules = load_state()
+    alloc_stats = allocation_engine.AllocationStats()   # 每代在記憶體計入，存檔時落地
+    leaderboard = Leaderboard()
+    print(f"[evolve] 開始演化 {generations} 代，symbols: {symbols}，每 {checkpoint_every} 代存檔")
+
+    first_generation = generation_store.latest_generation() or 0   # 排行榜記錄的世代 = 已存世代之後接續編號
+    start = time.perf_counter()
+    done, saved = 0, True
+    new_kings = []   # 上次存檔後加冕的王者，存檔時一次 append 進 godline
+    try:
+        for gen in range(1, generations + 1):
+            if v3_controller.ENABLE_BANDIT_ALLOCATION and gen > 1:
+                # 每代依最新統計重新分配預算
+                plan = allocation_engine.allocate(
+                    symbols, alloc_stats, budget=v3_controller.MODULE_BUDGET,
+                    seed=None if seed is None else seed * 100003 + gen,
+                )
+                assignments = v3_controller.build_assignments(symbols, plan)
+            with metrics.span("v4"):
+                modules, report = v4_generator.generate_generation(
+                    king_pool.top(), previous_modules, symbols, verbose=False, assignments=assignments,
+                    backtest=V4_BACKTEST,
+                )
+            with metrics.span("v5"):
+                result = v5_verifier.verify_generation(
+                    modules, king_pool=king_pool, godline=godline, run_seed=f"{seed}-{gen}", leaderboard=leaderboard,
+                    generation=first_generation + gen,
+                )
+            previous_modules = result.modules
+            alloc_stats.observe(result.modules)
+            new_kings.append(result.king)
+            done, saved = gen, False
+            metrics.incr("generations")
+
+            if gen % checkpoint_every == 0 or _stop_requested:
+                checkpoint(king_pool, new_kings, result.modules, report, alloc_stats, leaderboard,
+                           first_generation + done)
+                saved = True
+            if gen % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                print(f"[evolve] 第 {gen} 代 | 王者 {result.king['id']} ({result.king['score']}) | {gen / elapsed:.2f} 代/秒")
+            if _stop_requested:
+                break
+        if done and not saved:
+            checkpoint(king_pool, new_kings, result.modules, report, alloc_stats, leaderboard,
+                       first_generation + done)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        if DEFER_WRITES:
+            defer_writes(False)   # 中途出錯也把已算好的族譜 / 回測結果寫入
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"[evolve] 完成 {done} 代，耗時 {elapsed:.2f}s，{rate:.2f} 代/秒")
+    return {"generations": done, "elapsed_sec": round(elapsed, 3), "generations_per_sec": round(rate, 3)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Killcore 連續演化（v3 → v4 → v5）")
+    parser.add_argument("-n", "--generations", type=int, default=GENERATIONS)
+    parser.add_argument("-k", "--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--replay", action="store_true", help="先重播 ~/Killcore/replay 並以串流緩衝回測")
+    parser.add_argument("--walk-forward", action="store_true", help="v5 改用 walk-forward + 行情分段樣本外計分")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"], default=None,
+                        help="整段演化另做 cProfile / tracemalloc 擷取")
+    args = parser.parse_args()
+    if args.walk_forward:
+        v5_verifier.VERIFY_MODE = "walk_forward"
+    with metrics.run("evolve", profile=args.profile):
+        evolve(args.generations, args.checkpoint_every, args.seed, args.replay)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# === 快取設定 ===
+FITNESS_DB_PATH = Path("~/Killcore/fitness_cache.db").expanduser()
+MAX_ENTRIES = 200000          # 記憶體 LRU 筆數上限
+MAX_AGE_SEC = 7 * 24 * 3600   # 磁碟上超過此時間的結果視為過期
+PARAM_DECIMALS = 4            # sl_pct / tp_pct：與突變器輸出同精度，命中即等於重新回測
+COST_DECIMALS = 4             # 手續費 / 滑點
+PRUNE_EVERY_SEC = 3600        # 長時間執行（evolve）中定期依時間淘汰
+_BATCH = 500                  # SQLite IN (...) 每批鍵數
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fitness (
+    key TEXT PRIMARY KEY,
+    symbol TEXT,
+    timeframe TEXT,
+    window TEXT,
+    result BLOB,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_fitness_window ON fitness(symbol, timeframe, window);
+CREATE INDEX IF NOT EXISTS idx_fitness_created ON fitness(created_at);
+"""
+
+def window_hash(ohlcv):
+    # K 線區間指紋：資料更新（串流新 K、CSV 換檔）即換鍵
+    data = np.ascontiguousarray(ohlcv)
+    return hashlib.blake2b(data.tobytes(), digest_size=8).hexdigest()
+
+def quantize(value, decimals):
+    return f"{round(float(value), decimals):.{decimals}f}"
+
+def quantize_columns(strategy_types, ma_fast, ma_slow, sl_pct, tp_pct):
+    # 回測前先量化，快取鍵與實際回測的參數完全一致
+    return (
+        strategy_types, ma_fast, ma_slow,
+        np.round(np.asarray(sl_pct, dtype=float), PARAM_DECIMALS).tolist(),
+        np.round(np.asarray(tp_pct, dtype=float), PARAM_DECIMALS).tolist(),
+    )
+
+def quantize_costs(values):
+    if isinstance(values, list):
+        return np.round(np.asarray(values, dtype=float), COST_DECIMALS).tolist()
+    return round(float(values), COST_DECIMALS)
+
+def fitness_keys(symbol, timeframe, window, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct, slippage_pct):
+    n = len(strategy_types)
+    fee = np.broadcast_to(np.asarray(fee_pct, dtype=float), (n,)).tolist()
+    slip = np.broadcast_to(np.asarray(slippage_pct, dtype=float), (n,)).tolist()
+    prefix = f"{symbol}|{timeframe}|{window}"
+    return [
+        f"{prefix}|{s}|{int(f)}|{int(w)}|{quantize(sl, PARAM_DECIMALS)}|{quantize(tp, PARAM_DECIMALS)}"
+        f"|{quantize(fe, COST_DECIMALS)}|{quantize(sp, COST_DECIMALS)}"
+        for s, f, w, sl, tp, fe, sp in zip(strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee, slip)
+    ]
+
+class FitnessCache:
+    # 回測結果（RESULT_DTYPE 一列）的兩層快取：記憶體 LRU → SQLite
+    def __init__(self, dtype, path=FITNESS_DB_PATH, max_entries=MAX_ENTRIES, max_age_sec=MAX_AGE_SEC):
+        self.dtype = np.dtype(dtype)
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age_sec = max_age_sec
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+        self._windows = {}
+        self._conn = None
+        self._pid = None
+        self._pruned_at = 0.0
+        self._deferred_pid = None   # 延後寫入的進程（evolve 在存檔時才落地；平行驗證子進程照常直寫）
+        self._pending = []
+
+    def __len__(self):
+        return len(self._store)
+
+    def stats(self):
+        return {"entries": len(self._store), "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+    def clear(self):
+        self._store.clear()
+        self._windows.clear()
+
+    def _db(self):
+        # 每個進程各自連線（平行驗證的子進程不可共用 fork 前的連線）
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._pid = os.getpid()
+            self.prune()
+        return self._conn
+
+    # === 失效 ===
+    def _cutoff(self):
+        return time.time() - self.max_age_sec if self.max_age_sec else None
+
+    def prune(self):
+        # 依時間淘汰過期結果（磁碟 + 記憶體）
+        self._pruned_at = time.time()
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return 0
+        for key in [k for k, (_, created) in self._store.items() if created < cutoff]:
+            del self._store[key]
+        with self._conn:
+            cur = self._conn.execute("DELETE FROM fitness WHERE created_at < ?", (cutoff,))
+        return cur.rowcount
+
+    def invalidate_window(self, symbol, timeframe, window):
+        # 同幣種出現新的 K 線區間時，刪掉舊區間的結果
+        if self._windows.get((symbol, timeframe)) == window:
+            return 0
+        self._windows[(symbol, timeframe)] = window
+        db = self._db()
+        with db:
+            cur = db.execute(
+                "DELETE FROM fitness WHERE symbol = ? AND timeframe = ? AND window != ?", (symbol, timeframe, window)
+            )
+        prefix = f"{symbol}|{timeframe}|"
+        for key in [k for k in self._store if k.startswith(prefix) and not k.startswith(prefix + window)]:
+            del self._store[key]
+        return cur.rowcount
+
+    # === 讀寫 ===
+    def get_many(self, keys):
+        # 回傳 (命中遮罩, 結果陣列)；未命中的列為零值
+        out = np.zeros(len(keys), dtype=self.dtype)
+        found = np.zeros(len(keys), dtype=bool)
+        pending = {}
+        cutoff = self._cutoff()
+        for i, key in enumerate(keys):
+            entry = self._store.get(key)
+            if entry is not None and cutoff is not None and entry[1] < cutoff:
+                del self._store[key]
+                entry = None
+            if entry is not None:
+                self._store.move_to_end(key)
+                out[i] = entry[0]
+                found[i] = True
+            else:
+                pending.setdefault(key, []).append(i)
+        self.hits += int(found.sum())
+
+        if pending:
+            db = self._db()
+            todo = list(pending)
+            for lo in range(0, len(todo), _BATCH):
+                chunk = todo[lo:lo + _BATCH]
+                marks = ",".join("?" * len(chunk))
+                sql = f"SELECT key, result, created_at FROM fitness WHERE key IN ({marks}) AND created_at >= ?"
+                for key, blob, created in db.execute(sql, chunk + [cutoff or 0.0]):
+                    row = np.frombuffer(blob, dtype=self.dtype)[0]
+                    self._put(key, row, created)
+                    for i in pending[key]:
+                        out[i] = row
+                        found[i] = True
+                        self.disk_hits += 1
+        self.misses += int((~found).sum())
+        return found, out
+
+    def put_many(self, symbol, timeframe, window, keys, rows):
+        now = time.time()
+        records = []
+        for key, row in zip(keys, rows):
+            self._put(key, row.copy(), now)
+            records.append((key, symbol, timeframe, window, row.tobytes(), now))
+        if self._deferred_pid == os.getpid():
+            self._pending.extend(records)
+            return
+        self._write(records)
+
+    def _write(self, records):
+        db = self._db()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO fitness VALUES (?,?,?,?,?,?)", records)
+        if time.time() - self._pruned_at >= PRUNE_EVERY_SEC:
+            self.prune()
+
+    # === 延後寫入 ===
+    def defer_writes(self, enabled=True):
+        # 開啟後 put_many 只進記憶體，flush() 時一次寫入 SQLite
+        if not enabled:
+            self.flush()
+        self._deferred_pid = os.getpid() if enabled else None
+
+    def flush(self):
+        records, self._pending = self._pending, []
+        if records:
+            self._write(records)
+        return len(records)
+
+    def _put(self, key, row, created):
+        self._store[key] = (row, created)
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_entries:
+            self._store.popitem(last=False)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from state_io import file_lock, locked_append
+
+# === 檔案路徑 ===
+STORE_PATH = Path("~/Killcore/v4_store").expanduser()
+LEGACY_MODULE_PATH = Path("~/Killcore/v4_modules").expanduser()
+
+# === 數值欄位（列式存放，其餘欄位寫入 sidecar）===
+INT_FIELDS = ("mutate_generation", "trade_count", "fail_count", "divine_rounds", "backtest_bars")
+FLOAT_FIELDS = (
+    "mutation_strength", "virtual_capital", "resurrection_chance", "score", "sharpe", "win_rate",
+    "drawdown", "return_pct", "adjusted_return_pct", "net_profit", "entry_price", "exit_price",
+    "divine_score",
+)
+NUMERIC_FIELDS = INT_FIELDS + FLOAT_FIELDS
+COLUMN_DTYPE = np.dtype(
+    [("present", "<u4")] + [(k, "<i8") for k in INT_FIELDS] + [(k, "<f8") for k in FLOAT_FIELDS]
+)
+_BIT = {k: 1 << i for i, k in enumerate(NUMERIC_FIELDS)}
+
+def _paths(generation):
+    stem = STORE_PATH / f"gen_{generation:06d}"
+    return stem.with_suffix(".cols"), stem.with_suffix(".jsonl")
+
+def list_generations():
+    if not STORE_PATH.exists():
+        return []
+    return sorted(int(p.stem[4:]) for p in STORE_PATH.glob("gen_*.cols"))
+
+def latest_generation():
+    gens = list_generations()
+    return gens[-1] if gens else None
+
+def next_generation():
+    return (latest_generation() or 0) + 1
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+# === 寫入（整批 append）===
+def append_modules(generation, modules):
+    STORE_PATH.mkdir(parents=True, exist_ok=True)
+    cols_path, side_path = _paths(generation)
+
+    cols = np.zeros(len(modules), dtype=COLUMN_DTYPE)
+    lines = []
+    for i, mod in enumerate(modules):
+        present = 0
+        rest = {}
+        for k, v in mod.items():
+            if k in _BIT and _is_number(v):
+                cols[k][i] = v
+                present |= _BIT[k]
+            else:
+                rest[k] = v
+        cols["present"][i] = present
+        lines.append(json.dumps(rest, separators=(",", ":")))
+
+    with file_lock(cols_path):
+        with locked_append(side_path) as f:
+            f.write(("\n".join(lines) + ("\n" if lines else "")).encode("utf-8"))
+        with cols_path.open("ab") as f:
+            cols.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+    return generation
+
+def write_generation(modules, generation=None):
+    # 世代編號的配發與寫入在同一把鎖內，避免兩個 v4 同時拿到同一代
+    with file_lock(STORE_PATH / "store"):
+        generation = generation or next_generation()
+        append_modules(generation, modules)
+    return generation
+
+# === 讀取 ===
+def open_columns(generation):
+    # 唯讀 memory-map，只需數值欄位（例如分數排序）時不必解析 sidecar
+    cols_path, _ = _paths(generation)
+    if cols_path.stat().st_size == 0:
+        return np.zeros(0, dtype=COLUMN_DTYPE)
+    return np.memmap(cols_path, dtype=COLUMN_DTYPE, mode="r")
+
+def read_generation(generation):
+    cols_path, side_path = _paths(generation)
+    with file_lock(cols_path, shared=True):
+        cols = np.array(open_columns(generation))
+    modules = []
+    with side_path.open() as f:
+        for i, line in enumerate(f):
+            mod = json.loads(line)
+            present = int(cols["present"][i])
+            for k in INT_FIELDS:
+                if present & _BIT[k]:
+                    mod[k] = int(cols[k][i])
+            for k in FLOAT_FIELDS:
+                if present & _BIT[k]:
+                    mod[k] = float(cols[k][i])
+            modules.append(mod)
+    return modules
+
+def read_latest():
+    generation = latest_generation()
+    return read_generation(generation) if generation is not None else []
+
+# === 相容輸出：舊版逐模組 JSON ===
+def export_json(generation, out_dir=LEGACY_MODULE_PATH):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    modules = read_generation(generation)
+    for mod in modules:
+        with (out_dir / f"{mod['id']}.json").open("w") as f:
+            json.dump(mod, f, indent=2)
+    print(f"[store] 第 {generation} 代已輸出 {len(modules)} 個 JSON 至 {out_dir}")
+    return len(modules)
+
+if __name__ == "__main__":
+    import sys
+    gen = int(sys.argv[1]) if len(sys.argv) > 1 else latest_generation()
+    if gen is None:
+        print("[store] 尚無任何世代資料")
+    else:
+        export_json(gen)
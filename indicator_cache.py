@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+import numpy as np
+
+from fitness_cache import window_hash
+
+# === 快取設定 ===
+MAX_ENTRIES = 512   # 每筆為一條 (symbol, timeframe, window) 均線
+
+def rolling_mean(close, windows):
+    # 以累積和一次算出每個視窗的均線，暖機區間為 NaN
+    windows = np.maximum(np.asarray(windows, dtype=np.int64), 1)
+    csum = np.concatenate(([0.0], np.cumsum(close)))
+    t = np.arange(len(close))
+    lo = t[None, :] + 1 - windows[:, None]
+    ma = (csum[t + 1][None, :] - csum[np.maximum(lo, 0)]) / windows[:, None]
+    ma[lo < 0] = np.nan
+    return ma
+
+class IndicatorCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+
+    def __len__(self):
+        return len(self._store)
+
+    def clear(self):
+        self._store.clear()
+
+    def stats(self):
+        return {"entries": len(self._store), "hits": self.hits, "misses": self.misses}
+
+    def rolling_means(self, symbol, timeframe, close, windows):
+        # 同一代只對不重複的視窗計算一次，再依模組展開成 (modules × bars)
+        windows = np.maximum(np.asarray(windows, dtype=np.int64), 1)
+        uniq, inverse = np.unique(windows, return_inverse=True)
+        # 以整段收盤價的指紋判斷是否過期：固定長度的滑動視窗、最後收盤價相同時也會換鍵
+        stamp = window_hash(close)
+        rows = np.empty((len(uniq), len(close)))
+
+        todo = []
+        for i, w in enumerate(uniq):
+            key = (symbol, timeframe, int(w))
+            entry = self._store.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._store.move_to_end(key)
+                rows[i] = entry[1]
+                self.hits += 1
+            else:
+                todo.append(i)
+
+        if todo:
+            fresh = rolling_mean(close, uniq[todo])
+            for j, i in enumerate(todo):
+                rows[i] = fresh[j]
+                self._put((symbol, timeframe, int(uniq[i])), stamp, fresh[j])
+            self.misses += len(todo)
+
+        return rows[inverse]
+
+    def _put(self, key, stamp, values):
+        self._store[key] = (stamp, values)
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_entries:
+            self._store.popitem(last=False)
+
+INDICATOR_CACHE = IndicatorCache()
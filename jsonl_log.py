@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+from state_io import file_lock
+
+# === 日誌設定 ===
+MAX_BYTES = 32 * 1024 * 1024   # 單檔上限，超過即輪替
+MAX_FILES = 5                  # 保留 path.1 ~ path.N
+TAIL_SIZE = 100                # 記憶體內保留最近幾筆
+_BLOCK = 64 * 1024
+
+class JsonlLog:
+    # JSON Lines 日誌：O(1) append、依大小或時間輪替、從檔尾倒讀最近 N 筆
+    def __init__(self, path, max_bytes=MAX_BYTES, max_files=MAX_FILES, rotate_every_sec=None,
+                 tail_size=TAIL_SIZE, legacy_path=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.rotate_every_sec = rotate_every_sec
+        self._tail = deque(maxlen=tail_size) if tail_size else None
+        self._tail_loaded = False
+        if legacy_path is not None:
+            self._migrate(Path(legacy_path))
+
+    def _migrate(self, legacy_path):
+        # 舊版整檔 JSON list → JSON Lines（只做一次）
+        if self.path.exists() or not legacy_path.exists():
+            return
+        with legacy_path.open() as f:
+            entries = json.load(f)
+        self.extend(entries if isinstance(entries, list) else [entries])
+        legacy_path.rename(legacy_path.with_name(legacy_path.name + ".migrated"))
+        print(f"[log] 已轉換 {legacy_path.name} → {self.path.name}（{len(entries)} 筆）")
+
+    def _rotated(self, i):
+        return self.path.with_name(f"{self.path.name}.{i}")
+
+    def _should_rotate(self, incoming):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return False
+        if self.max_bytes and st.st_size + incoming > self.max_bytes and st.st_size > 0:
+            return True
+        if self.rotate_every_sec:
+            return int(st.st_mtime // self.rotate_every_sec) != int(time.time() // self.rotate_every_sec)
+        return False
+
+    def rotate(self):
+        if not self.path.exists():
+            return
+        oldest = self._rotated(self.max_files)
+        if oldest.exists():
+            oldest.unlink()
+        for i in range(self.max_files - 1, 0, -1):
+            src = self._rotated(i)
+            if src.exists():
+                src.rename(self._rotated(i + 1))
+        if self.max_files > 0:
+            self.path.rename(self._rotated(1))
+        else:
+            self.path.unlink()
+
+    # === 寫入 ===
+    def append(self, entry):
+        self.extend([entry])
+
+    def extend(self, entries):
+        if not entries:
+            return
+        data = "".join(json.dumps(e) + "\n" for e in entries).encode("utf-8")
+        with file_lock(self.path):
+            if self._should_rotate(len(data)):
+                self.rotate()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("ab") as f:
+                f.write(data)
+        if self._tail is not None and self._tail_loaded:
+            self._tail.extend(entries)
+
+    # === 讀取 ===
+    def files(self):
+        # 由舊到新
+        rotated = [self._rotated(i) for i in range(self.max_files, 0, -1)]
+        return [p for p in rotated + [self.path] if p.exists()]
+
+    def __iter__(self):
+        for path in self.files():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def read_all(self):
+        return list(self)
+
+    def last(self):
+        entries = self.tail(1)
+        return entries[-1] if entries else None
+
+    def tail(self, n):
+        if n <= 0:
+            return []
+        if self._tail is not None:
+            if not self._tail_loaded:
+                self._tail.extend(self._read_tail(self._tail.maxlen))
+                self._tail_loaded = True
+            if n <= self._tail.maxlen:
+                return list(self._tail)[-n:]
+        return self._read_tail(n)
+
+    def _read_tail(self, n):
+        # 從最新檔案的檔尾往前讀，不解析整份歷史
+        found = []
+        for path in reversed(self.files()):
+            lines = _tail_lines(path, n - len(found))
+            found = [json.loads(line) for line in lines] + found
+            if len(found) >= n:
+                break
+        return found[-n:]
+
+def _tail_lines(path, n):
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        while pos > 0 and buf.count(b"\n") <= n:
+            step = min(_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    lines = [line for line in buf.decode("utf-8").splitlines() if line.strip()]
+    return lines[-n:]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import heapq
+import json
+from itertools import count
+from pathlib import Path
+
+from state_io import atomic_write_json, file_lock, file_signature
+
+# === 王者池設定 ===
+KING_PATH = Path("~/Killcore/king_pool.json").expanduser()
+CAPACITY = 100
+COMPACT_EVERY = 1000   # log 累積幾筆後自動壓回 king_pool.json
+
+class KingPool:
+    # 以容量固定的最小堆保存前 N 名；新增只寫 append-only log，定期壓縮回快照
+    def __init__(self, path=KING_PATH, capacity=CAPACITY, compact_every=COMPACT_EVERY):
+        self.path = Path(path)
+        self.log_path = self.path.with_suffix(".log")
+        self.capacity = capacity
+        self.compact_every = compact_every
+        self._heap = []
+        self._seq = count()
+        self._pending = 0
+        self._signature = None   # 上次由本物件讀 / 寫後的檔案簽章
+        self.load()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return iter(self.top())
+
+    def load(self):
+        with file_lock(self.path, shared=True):
+            self._load()
+
+    def _load(self):
+        # 呼叫端須持有鎖
+        self._heap = []
+        self._pending = 0
+        if self.path.exists():
+            with self.path.open() as f:
+                for mod in json.load(f):
+                    self._admit(mod)
+        if self.log_path.exists():
+            with self.log_path.open() as f:
+                for line in f:
+                    if line.strip():
+                        self._admit(json.loads(line))
+                        self._pending += 1
+        self._signature = self._current_signature()
+
+    def _current_signature(self):
+        return file_signature((self.path, self.log_path))
+
+    def _stale(self):
+        # 快照或 log 被其他進程改過（stat 比對，不讀檔）
+        return self._current_signature() != self._signature
+
+    def refresh(self):
+        if self._stale():
+            with file_lock(self.path, shared=True):
+                self._load()
+        return self
+
+    def min_score(self):
+        return self._heap[0][0] if self._heap else None
+
+    def _admit(self, mod):
+        item = (mod["score"], next(self._seq), mod)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, item)
+            return True
+        if mod["score"] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+            return True
+        return False
+
+    def insert(self, mod):
+        return bool(self.insert_many([mod]))
+
+    def insert_many(self, mods):
+        with file_lock(self.path):
+            if self._stale():
+                self._load()   # 別的進程寫過：先重讀，避免以舊堆判斷淘汰
+            admitted = [mod for mod in mods if self._admit(mod)]
+            if admitted:
+                with self.log_path.open("a") as f:
+                    f.write("".join(json.dumps(mod) + "\n" for mod in admitted))
+                self._signature = self._current_signature()
+        if admitted:
+            self._pending += len(admitted)
+            if self._pending >= self.compact_every:
+                self.compact()
+        return admitted
+
+    def reset(self, mods):
+        # 只改記憶體，下次 compact() 才落地
+        self._heap = []
+        for mod in mods:
+            self._admit(mod)
+
+    def replace(self, mods):
+        self.reset(mods)
+        self.compact()
+
+    def top(self, n=None):
+        ranked = [item[2] for item in sorted(self._heap, key=lambda x: (-x[0], x[1]))]
+        return ranked if n is None else ranked[:n]
+
+    def compact(self):
+        # 快照與 log 同一把鎖：先原子替換快照，再清掉已併入的 log
+        with file_lock(self.path):
+            atomic_write_json(self.path, self.top(), lock=False)
+            if self.log_path.exists():
+                self.log_path.unlink()
+            self._signature = self._current_signature()
+        self._pending = 0
+
+_POOLS = {}
+
+def get_king_pool(path=KING_PATH):
+    # 同一進程共用一個 KingPool：逐筆寫入不必每次重讀快照與 log，檔案被別人改過才重新載入
+    path = Path(path)
+    pool = _POOLS.get(path)
+    if pool is None:
+        pool = _POOLS[path] = KingPool(path)
+    return pool.refresh()
+
+def load_king_pool(path=KING_PATH):
+    # 唯讀載入（含尚未壓縮的 log），由高分到低分
+    return KingPool(path).top()
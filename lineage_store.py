@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+# === 檔案路徑 ===
+LINEAGE_DB_PATH = Path("~/Killcore/lineage.db").expanduser()
+NODE_CACHE_SIZE = 200000     # 記憶體內 (父, 深度, 跳躍) 快取上限，超過即清空重建
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lineage (
+    uid TEXT PRIMARY KEY,
+    id TEXT,
+    parent_uid TEXT,
+    symbol TEXT,
+    strategy_type TEXT,
+    stage TEXT,
+    mutate_generation INTEGER,
+    mutation TEXT,
+    ancestor_god_id TEXT,
+    score REAL,
+    is_king INTEGER DEFAULT 0,
+    eliminated INTEGER,
+    created_at TEXT,
+    depth INTEGER DEFAULT 0,
+    jump_uid TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_lineage_parent ON lineage(parent_uid);
+CREATE INDEX IF NOT EXISTS idx_lineage_symbol_king ON lineage(symbol, is_king);
+CREATE INDEX IF NOT EXISTS idx_lineage_god ON lineage(ancestor_god_id);
+"""
+
+def module_uid(mod):
+    # 舊資料沒有 uid 時退回 id
+    return mod.get("uid") or mod.get("id")
+
+def mutation_delta(parent_params, params):
+    delta = {}
+    for k, v in params.items():
+        pv = parent_params.get(k)
+        if isinstance(v, (int, float)) and isinstance(pv, (int, float)) and v != pv:
+            delta[k] = round(v - pv, 6)
+    return delta
+
+class LineageStore:
+    # 每個模組只記一筆（父指標 + 突變差異 + 階段），祖先 / 後代 / 神祖查詢走索引
+    def __init__(self, path=LINEAGE_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self._nodes = {}
+        self._deferred = False
+        self._pending = []          # 延後寫入的 (sql, rows)，flush() 依序執行
+        self._pending_nodes = {}    # 尚未落地的節點，祖先查詢仍找得到
+        self._migrate()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    # === 延後寫入（evolve 每 K 代落地一次）===
+    def defer_writes(self, enabled=True):
+        if not enabled:
+            self.flush()
+        self._deferred = enabled
+
+    def flush(self):
+        ops, self._pending = self._pending, []
+        if ops:
+            with self.conn:
+                for sql, rows in ops:
+                    self.conn.executemany(sql, rows)
+        for uid, node in self._pending_nodes.items():
+            self._cache_node(uid, node)
+        self._pending_nodes.clear()
+        return sum(len(rows) for _, rows in ops)
+
+    def _write(self, sql, rows):
+        if self._deferred:
+            self._pending.append((sql, rows))
+            return
+        with self.conn:
+            self.conn.executemany(sql, rows)
+
+    def _migrate(self):
+        # 舊版 lineage.db 沒有 depth / jump_uid：補欄位並一次回填
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(lineage)")}
+        if "jump_uid" in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE lineage ADD COLUMN depth INTEGER DEFAULT 0")
+            self.conn.execute("ALTER TABLE lineage ADD COLUMN jump_uid TEXT")
+        parent_of = dict(self.conn.execute("SELECT uid, parent_uid FROM lineage"))
+        depth = {}
+        for uid in parent_of:
+            path, on_path, cur = [], set(), uid
+            while cur not in depth and cur in parent_of and cur not in on_path:
+                path.append(cur)
+                on_path.add(cur)
+                cur = parent_of[cur]
+            base = depth.get(cur, -1 if cur in on_path or cur is None else 0)
+            for i, node in enumerate(reversed(path)):
+                depth[node] = base + 1 + i
+        overlay = {}
+        for uid in sorted(parent_of, key=depth.get):
+            parent_uid = parent_of[uid] if depth[uid] else None   # 環狀舊資料從斷點起算為根
+            overlay[uid] = self._make_node(uid, parent_uid, overlay)
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE lineage SET depth = ?, jump_uid = ? WHERE uid = ?",
+                [(node[1], node[2], uid) for uid, node in overlay.items()],
+            )
+        if overlay:
+            print(f"[lineage] 已回填 {len(overlay)} 筆祖先跳躍指標")
+
+    # === 寫入 ===
+    def record_modules(self, modules, parents=None):
+        # parents: uid → 父模組 dict，用來算突變差異；整代一次交易寫入
+        parents = parents or {}
+        rows, overlay = [], {}
+        now = datetime.now().isoformat()
+        self._load_nodes({mod.get("parent_uid") or mod.get("parent_id") for mod in modules})
+        for mod in modules:
+            uid, parent_uid = module_uid(mod), mod.get("parent_uid") or mod.get("parent_id")
+            parent = parents.get(parent_uid, {})
+            node = overlay[uid] = self._make_node(uid, parent_uid, overlay)
+            rows.append((
+                uid, mod.get("id"), parent_uid, mod.get("symbol"), mod.get("strategy_type"),
+                mod.get("mutate_stage"), mod.get("mutate_generation", 0),
+                json.dumps(mutation_delta(parent.get("parameters", {}), mod.get("parameters", {}))),
+                mod.get("ancestor_god_id"), mod.get("score"), int(bool(mod.get("is_king"))),
+                None, mod.get("created_at", now), node[1], node[2],
+            ))
+        self._write("INSERT OR IGNORE INTO lineage VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        if self._deferred:
+            for uid, node in overlay.items():
+                self._pending_nodes.setdefault(uid, node)
+        else:
+            for uid, node in overlay.items():
+                self._cache_node(uid, node)
+
+    def record_roots(self, modules):
+        # 王者池等外部來源的祖先（無父代）
+        rows = [
+            (module_uid(m), m.get("id"), None, m.get("symbol"), m.get("strategy_type"), "root",
+             m.get("mutate_generation", 0), "{}", m.get("ancestor_god_id"), m.get("score"),
+             int(bool(m.get("is_king"))), None, m.get("created_at"), 0, module_uid(m))
+            for m in modules
+        ]
+        self._write("INSERT OR IGNORE INTO lineage VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        if self._deferred:
+            # 與 INSERT OR IGNORE 同語意：已存在的節點不覆寫
+            self._load_nodes({row[0] for row in rows})
+            for row in rows:
+                if self._known(row[0]) is None:
+                    self._pending_nodes.setdefault(row[0], (None, 0, row[0]))
+
+    def record_verification(self, modules):
+        self._write(
+            "UPDATE lineage SET score = ?, is_king = ?, eliminated = ? WHERE uid = ?",
+            [(m.get("score"), int(bool(m.get("is_king"))), int(bool(m.get("eliminated"))), module_uid(m))
+             for m in modules],
+        )
+
+    # === 祖先跳躍指標 ===
+    # 每筆存 (父, 深度, 跳躍)；跳躍指標採 skew-binary 規則，任一祖先查詢只需 O(log 深度) 次主鍵讀取
+    def _make_node(self, uid, parent_uid, overlay=None):
+        parent = self._node(parent_uid, overlay) if parent_uid is not None else None
+        if parent_uid is None:
+            return (None, 0, uid)
+        if parent is None:
+            return (parent_uid, 1, parent_uid)   # 父代未入庫：視為深度 0 的根
+        jump = self._node(parent[2], overlay)
+        if jump is not None and parent[1] - jump[1] == jump[1] - self._depth(jump[2], overlay):
+            return (parent_uid, parent[1] + 1, jump[2])
+        return (parent_uid, parent[1] + 1, parent_uid)
+
+    def _depth(self, uid, overlay=None):
+        node = self._node(uid, overlay)
+        return node[1] if node is not None else 0
+
+    def _node(self, uid, overlay=None):
+        if overlay and uid in overlay:
+            return overlay[uid]
+        if uid in self._pending_nodes:
+            return self._pending_nodes[uid]
+        if uid in self._nodes:
+            return self._nodes[uid]
+        row = self.conn.execute(
+            "SELECT parent_uid, depth, jump_uid FROM lineage WHERE uid = ?", (uid,)
+        ).fetchone()
+        if row is None:
+            return None
+        node = (row[0], row[1] or 0, row[2] or uid)
+        self._cache_node(uid, node)
+        return node
+
+    def _load_nodes(self, uids):
+        # 整批預載（父代 + 其跳躍目標），寫入一代時不逐筆查詢
+        for _ in range(3):
+            missing = [u for u in uids if u is not None and u not in self._nodes and u not in self._pending_nodes]
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                for uid, parent_uid, depth, jump_uid in self.conn.execute(
+                    f"SELECT uid, parent_uid, depth, jump_uid FROM lineage WHERE uid IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    self._cache_node(uid, (parent_uid, depth or 0, jump_uid or uid))
+            uids = {node[2] for node in map(self._known, uids) if node is not None}
+
+    def _known(self, uid):
+        return self._pending_nodes.get(uid) or self._nodes.get(uid)
+
+    def _cache_node(self, uid, node):
+        if len(self._nodes) >= NODE_CACHE_SIZE:
+            self._nodes.clear()
+        self._nodes[uid] = node
+
+    # === 查詢 ===
+    def parent(self, uid):
+        node = self._node(uid)
+        return node[0] if node is not None else None
+
+    def depth(self, uid):
+        return self._depth(uid)
+
+    def ancestor_at_depth(self, uid, depth):
+        # 沿跳躍指標往上，O(log 深度)
+        node = self._node(uid)
+        while node is not None and node[1] > depth:
+            if self._depth(node[2]) >= depth and node[2] != uid:
+                uid = node[2]
+            else:
+                uid = node[0]
+            node = self._node(uid)
+        return uid if node is not None and node[1] == depth else None
+
+    def ancestors(self, uid, limit=None):
+        # 整條父鏈一次遞迴查詢；深度為上限，舊資料若有環也會停
+        self.flush()   # 直接查 SQL 的讀取先把暫存寫入落地
+        node = self._node(uid)
+        if node is None or node[0] is None or limit == 0:
+            return []
+        bound = node[1] if limit is None else min(limit, node[1])
+        return [r[0] for r in self.conn.execute(
+            """
+            WITH RECURSIVE chain(uid, n) AS (
+                SELECT ?, 1
+                UNION ALL
+                SELECT l.parent_uid, c.n + 1 FROM lineage l JOIN chain c ON l.uid = c.uid
+                WHERE l.parent_uid IS NOT NULL AND c.n < ?
+            )
+            SELECT uid FROM chain ORDER BY n
+            """,
+            (node[0], bound),
+        )]
+
+    def is_descendant(self, uid, ancestor_uid):
+        if uid == ancestor_uid:
+            return False
+        target = self._node(ancestor_uid)
+        if target is None:
+            # 祖先未入庫：只可能是深度 1 那代所指的父代
+            return self._root_parent(uid) == ancestor_uid
+        return target[1] < self._depth(uid) and self.ancestor_at_depth(uid, target[1]) == ancestor_uid
+
+    def _root_parent(self, uid):
+        root = self.ancestor_at_depth(uid, 1)
+        node = self._node(root) if root is not None else None
+        return node[0] if node is not None else None
+
+    def children(self, uid):
+        self.flush()
+        return [r[0] for r in self.conn.execute("SELECT uid FROM lineage WHERE parent_uid = ?", (uid,))]
+
+    def descendants(self, uid, limit=None):
+        found, frontier = [], [uid]
+        while frontier and (limit is None or len(found) < limit):
+            nxt = []
+            for cur in frontier:
+                nxt.extend(self.children(cur))
+            found.extend(nxt)
+            frontier = nxt
+        return found if limit is None else found[:limit]
+
+    def ancestor_god_id(self, uid):
+        self.flush()
+        row = self.conn.execute("SELECT ancestor_god_id FROM lineage WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
+
+    def kings_for_symbol(self, symbol, limit=10):
+        self.flush()
+        return [r[0] for r in self.conn.execute(
+            "SELECT id FROM lineage WHERE symbol = ? AND is_king = 1 ORDER BY rowid DESC LIMIT ?",
+            (symbol, limit),
+        )]
+
+    def recent_mutations(self, symbol, limit=10):
+        self.flush()
+        return [
+            {"id": r[0], "parent_uid": r[1], "stage": r[2], "delta": json.loads(r[3])}
+            for r in self.conn.execute(
+                "SELECT id, parent_uid, stage, mutation FROM lineage WHERE symbol = ? AND is_king = 1 "
+                "ORDER BY rowid DESC LIMIT ?",
+                (symbol, limit),
+            )
+        ]
+
+_STORES = {}
+
+def get_store(path=LINEAGE_DB_PATH):
+    path = Path(path)
+    if path not in _STORES:
+        _STORES[path] = LineageStore(path)
+    return _STORES[path]
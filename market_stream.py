@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import math
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import backtest_engine
+from state_io import atomic_write_json
+
+# === 串流設定 ===
+BUFFER_BARS = backtest_engine.BACKTEST_BARS
+STATS_WINDOW = 96           # 滾動指標視窗（根）
+TIMEFRAME_SEC = 3600
+REPLAY_PATH = Path("~/Killcore/replay").expanduser()
+CANDIDATE_PATH = Path("~/Killcore/v2_candidates.json").expanduser()
+TOP_N = 10
+
+# === 每幣種環形 K 線緩衝（預先配置，不重新分配）===
+class CandleRingBuffer:
+    def __init__(self, symbol, capacity=BUFFER_BARS, window=STATS_WINDOW):
+        self.symbol = symbol
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.ohlcv = np.zeros((capacity, 5), dtype=np.float64)
+        self.count = 0
+        self.head = 0
+        self.stats = RollingStats(window)
+        self.pending = False       # 最後一根是成交聚合中、尚未收盤的 K 線
+        self._pending_prev = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def last_ts(self):
+        return int(self.ts[(self.head - 1) % self.capacity]) if self.count else None
+
+    def last_close(self):
+        return float(self.ohlcv[(self.head - 1) % self.capacity, backtest_engine.CLOSE]) if self.count else None
+
+    def append(self, ts, o, h, l, c, v, closed=True):
+        # closed=False：成交開出的新 K 線，等下一個時間桶開始（close_pending）才計入滾動指標
+        self.close_pending()
+        prev_close = self.last_close()
+        self.ts[self.head] = ts
+        self.ohlcv[self.head] = (o, h, l, c, v)
+        self.head = (self.head + 1) % self.capacity
+        self.count += 1
+        if closed:
+            self.stats.push(c, v, prev_close, o)
+        else:
+            self.pending = True
+            self._pending_prev = prev_close
+
+    def close_pending(self):
+        # 以收盤後的 close / 累積成交量計入滾動指標
+        if not self.pending:
+            return
+        row = self.ohlcv[(self.head - 1) % self.capacity]
+        self.stats.push(float(row[backtest_engine.CLOSE]), float(row[backtest_engine.VOLUME]), self._pending_prev,
+                        float(row[backtest_engine.OPEN]))
+        self.pending = False
+
+    def update_last(self, h, l, c, v):
+        # 尚未收盤的 K 線以成交更新（不動滾動指標，收盤時才計入）
+        i = (self.head - 1) % self.capacity
+        row = self.ohlcv[i]
+        row[1] = max(row[1], h)
+        row[2] = min(row[2], l)
+        row[3] = c
+        row[4] += v
+
+    def array(self):
+        # 依時間排序的 OHLCV 副本，供回測使用
+        n = len(self)
+        if self.count <= self.capacity:
+            return self.ohlcv[:n].copy()
+        return np.concatenate((self.ohlcv[self.head:], self.ohlcv[:self.head]))
+
+# === O(1) 滾動指標：波動、成交量、趨勢 ===
+class RollingStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.returns = np.zeros(window)
+        self.volumes = np.zeros(window)
+        self.closes = np.zeros(window + 1)
+        self.n = 0
+        self.sum_r = 0.0
+        self.sum_r2 = 0.0
+        self.sum_v = 0.0
+        self.base = None   # 第一根的開盤價：視窗未滿時趨勢的起點
+
+    def push(self, close, volume, prev_close=None, open_=None):
+        if self.n == 0:
+            self.base = open_
+        i = self.n % self.window
+        r = math.log(close / prev_close) if prev_close and close > 0 else 0.0
+        if self.n >= self.window:
+            old_r, old_v = self.returns[i], self.volumes[i]
+            self.sum_r -= old_r
+            self.sum_r2 -= old_r * old_r
+            self.sum_v -= old_v
+        self.returns[i] = r
+        self.volumes[i] = volume
+        self.closes[self.n % (self.window + 1)] = close
+        self.sum_r += r
+        self.sum_r2 += r * r
+        self.sum_v += volume
+        self.n += 1
+
+    def size(self):
+        return min(self.n, self.window)
+
+    def volatility(self):
+        k = self.size()
+        if k < 2:
+            return 0.0
+        mean = self.sum_r / k
+        return math.sqrt(max(0.0, self.sum_r2 / k - mean * mean))
+
+    def volume(self):
+        return self.sum_v
+
+    def trend(self):
+        k = self.size()
+        if k < 1:
+            return 0.0
+        last = self.closes[(self.n - 1) % (self.window + 1)]
+        if self.n > k:
+            first = self.closes[(self.n - 1 - k) % (self.window + 1)]
+        else:
+            first = self.base or self.closes[0]
+        return float((last - first) / first) if first else 0.0
+
+    def snapshot(self):
+        return {
+            "volatility": round(self.volatility(), 6),
+            "volume": round(self.volume(), 4),
+            "trend": round(self.trend(), 6),
+        }
+
+# === 資料來源 ===
+class FileReplaySource:
+    # 讀取 replay 目錄下的 <SYMBOL>.csv（與 backtest candles 同格式）或 .jsonl 訊息，依時間交錯重播
+    def __init__(self, path=REPLAY_PATH, symbols=None, delay=0.0):
+        self.path = Path(path)
+        self.symbols = symbols
+        self.delay = delay
+
+    def _messages(self):
+        streams = []
+        for file in sorted(self.path.glob("*.csv")):
+            symbol = file.stem.split("_")[0]
+            if self.symbols and symbol not in self.symbols:
+                continue
+            raw = np.genfromtxt(file, delimiter=",", names=True, dtype=float, encoding="utf-8")
+            names = {n.lower(): n for n in raw.dtype.names}
+            ts = raw[names["timestamp"]] if "timestamp" in names else np.arange(len(raw)) * TIMEFRAME_SEC
+            cols = [raw[names[c]] for c in backtest_engine.OHLCV_COLUMNS]
+            streams.append([
+                {"type": "kline", "symbol": symbol, "ts": int(t), "open": o, "high": h, "low": l, "close": c,
+                 "volume": v}
+                for t, o, h, l, c, v in zip(ts.tolist(), *(col.tolist() for col in cols))
+            ])
+        for file in sorted(self.path.glob("*.jsonl")):
+            with file.open() as f:
+                streams.append([json.loads(line) for line in f if line.strip()])
+        merged = [m for s in streams for m in s if not self.symbols or m.get("symbol") in self.symbols]
+        merged.sort(key=lambda m: m["ts"])
+        return merged
+
+    async def __aiter__(self):
+        for msg in self._messages():
+            yield msg
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            else:
+                await asyncio.sleep(0)
+
+# === 串流處理 ===
+class MarketStream:
+    def __init__(self, capacity=BUFFER_BARS, window=STATS_WINDOW, timeframe_sec=TIMEFRAME_SEC):
+        self.capacity = capacity
+        self.window = window
+        self.timeframe_sec = timeframe_sec
+        self.buffers = {}
+        self.messages = 0
+
+    def buffer(self, symbol):
+        buf = self.buffers.get(symbol)
+        if buf is None:
+            buf = self.buffers[symbol] = CandleRingBuffer(symbol, self.capacity, self.window)
+        return buf
+
+    def on_message(self, msg):
+        self.messages += 1
+        buf = self.buffer(msg["symbol"])
+        if msg["type"] == "kline":
+            buf.append(msg["ts"], msg["open"], msg["high"], msg["low"], msg["close"], msg["volume"])
+        elif msg["type"] == "trade":
+            # 成交依時間桶聚合成 K 線
+            bucket = msg["ts"] - msg["ts"] % self.timeframe_sec
+            price, qty = msg["price"], msg.get("qty", 0.0)
+            if buf.count and buf.last_ts() == bucket:
+                buf.update_last(price, price, price, qty)
+            else:
+                buf.append(bucket, price, price, price, price, qty, closed=False)
+
+    async def run(self, source, max_messages=None):
+        async for msg in source:
+            self.on_message(msg)
+            if max_messages and self.messages >= max_messages:
+                break
+        return self.messages
+
+    def rank(self, top_n=TOP_N):
+        # 波動 × 成交量為主，趨勢強度加權
+        metrics = {}
+        for symbol, buf in self.buffers.items():
+            snap = buf.stats.snapshot()
+            snap["score"] = round(snap["volatility"] * math.log1p(snap["volume"]) * (1 + abs(snap["trend"])), 8)
+            metrics[symbol] = snap
+        ranked = sorted(metrics, key=lambda s: metrics[s]["score"], reverse=True)[:top_n]
+        return ranked, metrics
+
+    def candles(self, symbol, timeframe=backtest_engine.TIMEFRAME):
+        buf = self.buffers.get(symbol)
+        return buf.array() if buf is not None and len(buf) >= 2 else None
+
+    def attach(self):
+        # 回測 / 驗證直接讀共享緩衝，不再重新載入 K 線
+        backtest_engine.set_candle_provider(self.candles)
+        return self
+
+    def write_candidates(self, path=CANDIDATE_PATH, top_n=TOP_N):
+        ranked, metrics = self.rank(top_n)
+        data = {
+            "generated_at": datetime.now().isoformat(),
+            "source": "stream",
+            "symbols": ranked,
+            "metrics": {s: metrics[s] for s in ranked},
+        }
+        atomic_write_json(path, data)
+        return data
+
+def replay_and_rank(path=REPLAY_PATH, symbols=None, top_n=TOP_N):
+    stream = MarketStream()
+    asyncio.run(stream.run(FileReplaySource(path, symbols)))
+    stream.attach()
+    return stream, stream.write_candidates(top_n=top_n)
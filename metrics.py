@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from jsonl_log import JsonlLog
+
+# === 量測設定 ===
+METRICS_PATH = Path("~/Killcore/metrics.jsonl").expanduser()
+PROFILE_PATH = Path("~/Killcore/profiles").expanduser()
+ENABLE_METRICS = True
+PROFILE_MODE = os.environ.get("KILLCORE_PROFILE", "")   # "cprofile" / "tracemalloc"，預設不開
+PROFILE_TOP = 25
+
+# === span（巢狀計時）+ counter，同名 span 彙總成次數 / 總時間 / 最長時間 ===
+class Recorder:
+    def __init__(self, name=None):
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self.spans = {}
+        self.counters = {}
+        self.stack = []
+
+    def add_span(self, path, elapsed, blocks, traced):
+        agg = self.spans.get(path)
+        if agg is None:
+            agg = self.spans[path] = {"count": 0, "total_sec": 0.0, "max_sec": 0.0, "alloc_blocks": 0}
+        agg["count"] += 1
+        agg["total_sec"] += elapsed
+        agg["max_sec"] = max(agg["max_sec"], elapsed)
+        agg["alloc_blocks"] += blocks
+        if traced is not None:
+            agg["traced_bytes"] = agg.get("traced_bytes", 0) + traced
+
+    def record(self):
+        return {
+            "run": self.name,
+            "started_at": self.started_at,
+            "finished_at": datetime.now().isoformat(),
+            "pid": os.getpid(),
+            "spans": {
+                path: {**agg, "total_sec": round(agg["total_sec"], 6), "max_sec": round(agg["max_sec"], 6)}
+                for path, agg in self.spans.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+_RECORDER = Recorder()
+
+def current():
+    return _RECORDER
+
+@contextmanager
+def span(name):
+    # 記錄耗時與期間淨增的記憶體區塊數（sys.getallocatedblocks）；tracemalloc 模式另記淨增位元組
+    if not ENABLE_METRICS:
+        yield
+        return
+    rec = _RECORDER
+    rec.stack.append(name)
+    path = "/".join(rec.stack)
+    tracing = tracemalloc.is_tracing()
+    traced = tracemalloc.get_traced_memory()[0] if tracing else None
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if tracing:
+            traced = tracemalloc.get_traced_memory()[0] - traced
+        rec.add_span(path, elapsed, sys.getallocatedblocks() - blocks, traced)
+        rec.stack.pop()
+
+def incr(name, n=1):
+    if ENABLE_METRICS:
+        _RECORDER.counters[name] = _RECORDER.counters.get(name, 0) + n
+
+def gauge(name, value):
+    if ENABLE_METRICS:
+        _RECORDER.counters[name] = value
+
+def metrics_log(path=METRICS_PATH):
+    return JsonlLog(path, tail_size=0)
+
+@contextmanager
+def run(name, path=METRICS_PATH, profile=None):
+    # 一次 v3 / v4 / v5 / evolve 執行：結束時把彙總寫成 metrics.jsonl 一行；巢狀呼叫時併入外層
+    global _RECORDER
+    if not ENABLE_METRICS or _RECORDER.name is not None:
+        with span(name):
+            yield _RECORDER
+        return
+    profile = PROFILE_MODE if profile is None else profile
+    _RECORDER = Recorder(name)
+    profiler, started_tracing = None, False
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True   # 外部（-X tracemalloc 等）已開的追蹤不由這裡關
+    try:
+        with span(name):
+            yield _RECORDER
+    finally:
+        rec, _RECORDER = _RECORDER, Recorder()
+        entry = rec.record()
+        if profiler is not None:
+            profiler.disable()
+            entry["profile"] = _dump_profile(profiler, name)
+        elif profile == "tracemalloc":
+            entry["tracemalloc"] = _tracemalloc_top()
+            if started_tracing:
+                tracemalloc.stop()
+        metrics_log(path).append(entry)
+        print(f"[metrics] {name}：{summary(entry)}")
+
+def _dump_profile(profiler, name):
+    PROFILE_PATH.mkdir(parents=True, exist_ok=True)
+    out = PROFILE_PATH / f"{name}_{datetime.now():%Y%m%d_%H%M%S}.prof"
+    profiler.dump_stats(out)
+    buf = io.StringIO()
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    print(f"[metrics] cProfile 已寫入 {out}")
+    return {"path": str(out), "top": buf.getvalue().splitlines()[-PROFILE_TOP - 2:]}
+
+def _tracemalloc_top():
+    snapshot = tracemalloc.take_snapshot()
+    current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    return {
+        "current_bytes": current_bytes,
+        "peak_bytes": peak_bytes,
+        "top": [
+            {"where": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+        ],
+    }
+
+def summary(entry):
+    # 依總時間排序的單行摘要
+    spans = sorted(entry["spans"].items(), key=lambda kv: kv[1]["total_sec"], reverse=True)
+    return " | ".join(f"{path} {agg['total_sec']:.3f}s" for path, agg in spans[:6])
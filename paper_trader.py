@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from king_pool import KING_PATH, load_king_pool
+from market_stream import TIMEFRAME_SEC
+from state_io import atomic_write_json, file_signature
+
+# === 模擬實盤設定 ===
+PAPER_PATH = Path("~/Killcore/v7_paper.json").expanduser()
+HISTORY_BARS = 1000          # 保留的收盤價（新王換參數時可直接暖機）
+START_CAPITAL = 70.51        # 與 v5 simulated_capital_start 相同
+PERSIST_EVERY = 50           # 每 N 筆平倉落地一次
+GODLINE_PATH = Path("~/Killcore/godline.jsonl").expanduser()
+WATCH_POLL_SEC = 0.05        # 王者檔案輪詢間隔（stat mtime / size）
+
+# === 增量指標：每根 K 只做 O(1) 更新 ===
+class IncrementalMA:
+    def __init__(self, window):
+        self.window = max(1, int(window))
+        self.values = deque(maxlen=self.window)
+        self.total = 0.0
+
+    def push(self, close):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(close)
+        self.total += close
+
+    def value(self):
+        # 暖機未滿時為 NaN（與 rolling_mean 相同，所有比較皆為 False）
+        return self.total / self.window if len(self.values) == self.window else math.nan
+
+class StrategyState:
+    # 與 backtest_engine._signals / _apply_stops 同語意的逐根版本
+    def __init__(self, strategy_type, params):
+        self.strategy_type = strategy_type or "C"
+        self.sl = float(params.get("sl_pct", 1.5))
+        self.tp = float(params.get("tp_pct", 3.0))
+        self.fast = IncrementalMA(params.get("ma_fast", 10))
+        self.slow = IncrementalMA(params.get("ma_slow", 30))
+        self.raw = False          # 訊號持倉狀態（未套停損停利）
+        self.stopped = False      # 本段訊號已觸發停損/停利
+        self.entry_close = None
+
+    def on_bar(self, close):
+        self.fast.push(close)
+        self.slow.push(close)
+        fast, slow = self.fast.value(), self.slow.value()
+        if self.strategy_type == "A":
+            enter, leave = fast > slow, fast <= slow
+        elif self.strategy_type == "B":
+            enter, leave = close < slow * (1 - self.sl / 100), close >= slow
+        else:
+            enter, leave = (close > fast) and (fast > slow), close < fast
+        prev = self.raw
+        if enter:
+            self.raw = True
+        elif leave:
+            self.raw = False
+        if self.raw and not prev:
+            self.entry_close = close
+            self.stopped = False
+        if self.raw and not self.stopped:
+            self.check_stop(close)
+        return self.position()
+
+    def check_stop(self, price):
+        move = price / self.entry_close - 1
+        if move <= -self.sl / 100 or move >= self.tp / 100:
+            self.stopped = True
+        return self.stopped
+
+    def position(self):
+        return self.raw and not self.stopped
+
+    @classmethod
+    def warmed(cls, strategy_type, params, closes):
+        # 以保留的收盤價重播，得到與一路跑下來相同的均線與訊號狀態（換王不必等新 K 暖機）
+        state = cls(strategy_type, params)
+        for close in closes:
+            state.on_bar(close)
+        return state
+
+# === 延遲直方圖（對數分桶，O(1) 記錄）===
+class LatencyHistogram:
+    def __init__(self, buckets_per_octave=8):
+        self.k = buckets_per_octave
+        self.counts = {}
+        self.n = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        b = int(math.log2(max(ns, 1)) * self.k)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.n += 1
+        self.max_ns = max(self.max_ns, ns)
+
+    def percentile(self, p):
+        if not self.n:
+            return 0.0
+        target = p / 100 * self.n
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= target:
+                return min(2 ** ((b + 1) / self.k), float(self.max_ns))   # 桶上界（ns），不超過實測最大值
+        return float(self.max_ns)
+
+    def summary(self):
+        return {
+            "count": self.n,
+            "p50_us": round(self.percentile(50) / 1000, 2),
+            "p99_us": round(self.percentile(99) / 1000, 2),
+            "max_us": round(self.max_ns / 1000, 2),
+        }
+
+# === 模擬實盤執行器 ===
+def king_key(king):
+    # 同一王者只更新連任等欄位時不必換參數
+    params = json.dumps(king.get("parameters", {}), sort_keys=True)
+    return king.get("id"), king.get("symbol"), king.get("strategy_type"), params
+
+class PaperTrader:
+    def __init__(self, king, timeframe_sec=TIMEFRAME_SEC, capital=None, history_bars=HISTORY_BARS):
+        self.timeframe_sec = timeframe_sec
+        self.history_bars = history_bars
+        self.histories = {}       # symbol → 最近收盤價（所有幣種都保留，換王換幣也是熱的）
+        self.bars = {}            # symbol → [時間桶, 最新價]（成交聚合中的 K）
+        self._set_king(king, StrategyState(king.get("strategy_type"), king.get("parameters", {})))
+        start = capital if capital is not None else king.get("simulated_capital_start", START_CAPITAL)
+        self.capital = float(start)
+        self.capital_curve = [self.capital]
+        self.trades = []
+        self.swaps = []
+        self.in_position = False
+        self.entry_adj = None
+        self.last_ts = None
+        self.last_price = None
+        self.ticks = 0
+        self.saved_trades = 0
+        self.latency = LatencyHistogram()
+
+    def _set_king(self, king, state):
+        self.king = king
+        self.symbol = king.get("symbol")
+        self.slippage = float(king.get("slippage_pct", 0.0))
+        self.fee = float(king.get("tx_fee_pct", 0.001))
+        self.state = state
+
+    # --- 進出場：成本模型與 v5 simulate_trade 相同 ---
+    def _open(self, price, ts):
+        self.entry_adj = price * (1 + self.slippage)
+        self.entry_ts = ts
+        self.in_position = True
+
+    def _close(self, price, ts, reason):
+        exit_adj = price * (1 - self.slippage)
+        net = exit_adj - self.entry_adj - (self.entry_adj + exit_adj) * self.fee
+        ret = net / self.entry_adj if self.entry_adj else 0.0
+        self.capital = round(self.capital * (1 + ret), 6)
+        self.capital_curve.append(round(self.capital, 2))
+        self.trades.append({
+            "entry_ts": self.entry_ts, "exit_ts": ts, "entry_adj": round(self.entry_adj, 6),
+            "exit_adj": round(exit_adj, 6), "return_pct": round(ret * 100, 4), "reason": reason,
+        })
+        self.in_position = False
+        self.entry_adj = None
+
+    def _sync(self, price, ts, reason):
+        want = self.state.position()
+        if want and not self.in_position:
+            self._open(price, ts)
+        elif not want and self.in_position:
+            self._close(price, ts, reason)
+
+    # --- 事件 ---
+    def on_bar_close(self, symbol, ts, close):
+        history = self.histories.get(symbol)
+        if history is None:
+            history = self.histories[symbol] = deque(maxlen=self.history_bars)
+        history.append(close)
+        if symbol == self.symbol:
+            self.last_ts, self.last_price = ts, close
+            self.state.on_bar(close)
+            self._sync(close, ts, "stop" if self.state.stopped else "signal")
+
+    def on_tick(self, symbol, ts, price):
+        # 成交：K 內即時檢查停損停利；跨到新時間桶時以上一根收盤價結算訊號
+        bucket = ts - ts % self.timeframe_sec
+        bar = self.bars.get(symbol)
+        if bar is None:
+            bar = self.bars[symbol] = [bucket, price]
+        elif bucket != bar[0]:
+            self.on_bar_close(symbol, bar[0], bar[1])
+            bar[0] = bucket
+        bar[1] = price
+        if symbol == self.symbol:
+            self.last_ts, self.last_price = ts, price
+            if self.in_position and self.state.raw and not self.state.stopped and self.state.check_stop(price):
+                self._sync(price, ts, "stop")
+
+    def on_message(self, msg):
+        t0 = time.perf_counter_ns()
+        symbol = msg.get("symbol")
+        if msg["type"] == "kline":
+            self.on_bar_close(symbol, msg["ts"], msg["close"])
+        elif msg["type"] == "trade":
+            self.on_tick(symbol, msg["ts"], msg["price"])
+        if symbol != self.symbol:
+            return False
+        self.ticks += 1
+        self.latency.record(time.perf_counter_ns() - t0)
+        return True
+
+    # --- 王者熱替換：在兩筆行情之間（事件迴圈同一執行緒）一次換掉參數與訊號狀態 ---
+    def swap_king(self, king, detected=None):
+        t0 = time.perf_counter()
+        symbol = king.get("symbol")
+        state = StrategyState.warmed(king.get("strategy_type"), king.get("parameters", {}),
+                                     self.histories.get(symbol, ()))
+        if self.in_position and (symbol != self.symbol or not state.position()):
+            self._close(self.last_price, self.last_ts, "swap")
+        old_id = self.king.get("id")
+        self._set_king(king, state)
+        bar = self.bars.get(symbol)
+        history = self.histories.get(symbol)
+        if bar is not None:
+            self.last_price = bar[1]
+        elif history:
+            self.last_price = history[-1]
+        else:
+            self.last_price = None
+        if self.last_price is not None:
+            self._sync(self.last_price, self.last_ts, "swap")
+        applied = time.perf_counter()
+        swap = {
+            "from": old_id, "to": king.get("id"), "symbol": symbol,
+            "warm_bars": len(history) if history else 0,
+            "apply_ms": round((applied - t0) * 1000, 3),
+            "detect_to_apply_ms": round((applied - (detected or t0)) * 1000, 3),
+            "swapped_at": datetime.now().isoformat(),
+        }
+        self.swaps.append(swap)
+        print(f"[v7] 王者替換：{old_id} → {swap['to']}（{symbol}，暖機 {swap['warm_bars']} 根，"
+              f"偵測到生效 {swap['detect_to_apply_ms']}ms）")
+        return swap
+
+    async def run(self, source, max_messages=None, persist_path=PAPER_PATH, watcher=None):
+        seen = 0
+        stop = asyncio.Event()
+        task = asyncio.create_task(watcher.watch(self, stop)) if watcher is not None else None
+        try:
+            async for msg in source:
+                self.on_message(msg)
+                if persist_path and len(self.trades) - self.saved_trades >= PERSIST_EVERY:
+                    self.save(persist_path)
+                seen += 1
+                if max_messages and seen >= max_messages:
+                    break
+        finally:
+            stop.set()
+            if task is not None:
+                await task
+        if persist_path:
+            self.save(persist_path)
+        return self.report()
+
+    def report(self):
+        return {
+            "king_id": self.king.get("id"),
+            "symbol": self.symbol,
+            "strategy_type": self.state.strategy_type,
+            "ticks": self.ticks,
+            "trades": len(self.trades),
+            "in_position": self.in_position,
+            "capital": round(self.capital, 2),
+            "latency": self.latency.summary(),
+            "swaps": len(self.swaps),
+        }
+
+    def save(self, path=PAPER_PATH):
+        self.saved_trades = len(self.trades)
+        atomic_write_json(path, {
+            "updated_at": datetime.now().isoformat(),
+            **self.report(),
+            "capital_curve": self.capital_curve,
+            "recent_trades": self.trades[-PERSIST_EVERY:],
+            "recent_swaps": self.swaps[-PERSIST_EVERY:],
+        })
+
+# === 王者檔案監看（輪詢 mtime / size，不依賴 inotify）===
+class KingWatcher:
+    # king_pool.json（含未壓縮的 .log）與 godline.jsonl 任一變動即重讀王者池第一名
+    def __init__(self, king_path=KING_PATH, godline_path=GODLINE_PATH, poll_sec=WATCH_POLL_SEC):
+        self.king_path = Path(king_path)
+        self.paths = [self.king_path, self.king_path.with_suffix(".log"), Path(godline_path)]
+        self.poll_sec = poll_sec
+        self.signature = file_signature(self.paths)
+
+    def changed(self):
+        sig = file_signature(self.paths)
+        if sig == self.signature:
+            return False
+        self.signature = sig
+        return True
+
+    def load(self):
+        pool = load_king_pool(self.king_path)
+        return pool[0] if pool else None
+
+    async def watch(self, trader, stop):
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.poll_sec)
+            except asyncio.TimeoutError:
+                pass
+            if stop.is_set() or not self.changed():
+                continue
+            detected = time.perf_counter()
+            # 讀檔丟到執行緒，行情迴圈不被阻塞；替換本身回到事件迴圈執行
+            king = await asyncio.to_thread(self.load)
+            if king is None:
+                continue
+            if king_key(king) != king_key(trader.king):
+                trader.swap_king(king, detected)
+            else:
+                trader.king = king
+
+# === 交易所格式的假資料源（離線測試用）===
+class StubExchangeFeed:
+    # 產生 Binance 風格的 trade 訊息（{"e": "trade", "s", "p", "q", "T"}），再正規化成 market_stream 格式
+    def __init__(self, symbol, ticks=10000, start_price=1000.0, ticks_per_bar=20, timeframe_sec=TIMEFRAME_SEC,
+                 vol=0.002, seed=None, delay=0.0):
+        self.symbol = symbol
+        self.ticks = ticks
+        self.price = start_price
+        self.step_ms = timeframe_sec * 1000 // ticks_per_bar
+        self.vol = vol
+        self.rng = random.Random(seed)
+        self.delay = delay
+
+    def raw(self, i):
+        self.price = max(0.01, self.price * math.exp(self.rng.gauss(0, self.vol)))
+        return {"e": "trade", "s": self.symbol, "p": f"{self.price:.4f}", "q": f"{self.rng.uniform(0.01, 2):.4f}",
+                "T": i * self.step_ms}
+
+    async def __aiter__(self):
+        for i in range(self.ticks):
+            yield normalize_message(self.raw(i))
+            await asyncio.sleep(self.delay)
+
+def normalize_message(raw):
+    # 交易所原始訊息 → market_stream 的 kline / trade 格式
+    if raw.get("e") == "trade":
+        return {"type": "trade", "symbol": raw["s"], "ts": raw["T"] // 1000, "price": float(raw["p"]),
+                "qty": float(raw["q"])}
+    if raw.get("e") == "kline":
+        k = raw["k"]
+        return {"type": "kline", "symbol": raw["s"], "ts": k["t"] // 1000, "open": float(k["o"]),
+                "high": float(k["h"]), "low": float(k["l"]), "close": float(k["c"]), "volume": float(k["v"])}
+    return raw
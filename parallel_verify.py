@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backtest_engine
+from backtest_engine import RESULT_DTYPE
+
+# === 平行驗證設定 ===
+VERIFY_WORKERS = os.cpu_count() or 1
+MIN_SHARD_SIZE = 64   # 模組太少時直接單程序，避免進程啟動成本
+
+# === 每模組固定種子：同 id + 同 run seed → 同一組隨機值 ===
+def module_seed(mod_id, run_seed):
+    digest = hashlib.blake2b(f"{run_seed}:{mod_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+def module_rng(mod, run_seed):
+    return random.Random(module_seed(mod.get("id"), run_seed))
+
+def _verify_shard(shm_name, total, start, mods, timeframe, with_costs):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    out = np.ndarray((total,), dtype=RESULT_DTYPE, buffer=shm.buf)
+    try:
+        backtest_engine.evaluate_into(mods, out[start:start + len(mods)], timeframe, with_costs)
+    finally:
+        del out
+        shm.close()
+    return len(mods)
+
+def evaluate_parallel(modules, workers=VERIFY_WORKERS, timeframe=backtest_engine.TIMEFRAME, with_costs=True):
+    # 把整代切片分給各進程，結果寫回共享記憶體中的結構化陣列，不經 pickle 回傳
+    total = len(modules)
+    workers = max(1, min(workers, total // MIN_SHARD_SIZE))
+    if workers <= 1:
+        return backtest_engine.evaluate_modules(modules, timeframe, with_costs)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total * RESULT_DTYPE.itemsize))
+    try:
+        results = np.ndarray((total,), dtype=RESULT_DTYPE, buffer=shm.buf)
+        bounds = np.linspace(0, total, workers + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_verify_shard, shm.name, total, lo, modules[lo:hi], timeframe, with_costs)
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+            ]
+            for fut in futures:
+                fut.result()
+        missing = backtest_engine.apply_results(modules, results.copy())
+        del results
+    finally:
+        shm.close()
+        shm.unlink()
+    return missing
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+# === 參數空間索引設定 ===
+REL_STEP = 0.01          # 浮點參數以相對 1% 為一格（對數刻度），整數參數逐值
+NN_SAMPLE = 512          # 每個 (幣種, 策略) 最多抽幾個模組量最近鄰距離（對全組比），成本 O(NN_SAMPLE × n)
+NN_MAX_ELEMS = 1 << 22   # 每塊距離矩陣元素上限（約 32 MB）
+
+def cell(value):
+    # 單一參數 → 量化格子；整數（均線長度）保留原值，浮點取對數後等比分格
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if isinstance(value, int):
+        return value
+    if value <= 0:
+        return ("z", round(value, 4))
+    return ("r", round(math.log(value) / math.log1p(REL_STEP)))
+
+def param_key(symbol, strategy_type, params):
+    return (symbol, strategy_type) + tuple((k, cell(v)) for k, v in sorted(params.items()))
+
+def module_key(mod):
+    return param_key(mod.get("symbol"), mod.get("strategy_type"), mod.get("parameters", {}))
+
+class ParamIndex:
+    # 本代已生成 + 上一代（v4_archive）的量化參數集合；重複的候選在生成時就重抽
+    def __init__(self, modules=()):
+        self.keys = set()
+        self.archive_keys = 0
+        self.checked = 0
+        self.resampled = 0
+        self.kept = 0
+        self.archive_hits = 0
+        self._archive = set()
+        self.add_archive(modules)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_archive(self, modules):
+        for mod in modules:
+            if mod.get("parameters") is not None:
+                self._archive.add(module_key(mod))
+        self.keys |= self._archive
+        self.archive_keys = len(self._archive)
+
+    def claim(self, keys):
+        # 回傳重複遮罩；不重複的鍵立即登記（同一批內也去重，先到先得）
+        dup = np.zeros(len(keys), dtype=bool)
+        for i, key in enumerate(keys):
+            if key in self.keys:
+                dup[i] = True
+                if key in self._archive:
+                    self.archive_hits += 1
+            else:
+                self.keys.add(key)
+        self.checked += len(keys)
+        return dup
+
+    def stats(self):
+        return {
+            "indexed": len(self.keys),
+            "archive": self.archive_keys,
+            "checked": self.checked,
+            "resampled": self.resampled,
+            "archive_hits": self.archive_hits,
+            "duplicates_kept": self.kept,
+        }
+
+# === 多樣性指標 ===
+def _param_matrix(mods):
+    # 回傳 (對數參數, 量化格子)；格子規則同 cell()，整批以 NumPy 計算
+    first = mods[0].get("parameters", {})
+    keys = sorted(k for k, v in first.items() if isinstance(v, (int, float)) and not isinstance(v, bool))
+    values = np.array([[m["parameters"].get(k, 0) for k in keys] for m in mods], dtype=float).reshape(len(mods), -1)
+    logs = np.log(np.maximum(values, 1e-9))
+    is_int = np.array([isinstance(first[k], int) for k in keys], dtype=bool)
+    cells = np.where(is_int[None, :], values, np.round(logs / math.log1p(REL_STEP)))
+    return logs, cells
+
+def _distinct(cells):
+    return len(np.unique(cells, axis=0)) if len(cells) else 0
+
+def nearest_neighbor_distance(points, sample=NN_SAMPLE, rng=None):
+    # 對數參數空間（相對差）的最近鄰距離：抽樣查詢點、對全組比，分塊限制記憶體
+    n = len(points)
+    if n < 2:
+        return np.full(min(n, 1), np.inf)   # 同組只有一個模組：無鄰居，不計入
+    if sample and n > sample:
+        rng = rng if rng is not None else np.random.default_rng(0)
+        query = np.sort(rng.choice(n, size=sample, replace=False))
+    else:
+        query = np.arange(n)
+    sq = (points * points).sum(axis=1)
+    out = np.empty(len(query))
+    step = max(1, NN_MAX_ELEMS // n)
+    for lo in range(0, len(query), step):
+        idx = query[lo:lo + step]
+        d2 = sq[idx, None] + sq[None, :] - 2 * points[idx] @ points.T
+        d2[np.arange(len(idx)), idx] = np.inf
+        out[lo:lo + step] = np.sqrt(np.maximum(d2.min(axis=1), 0.0))
+    return out
+
+def diversity(modules):
+    # distinct_ratio：不同量化格子 / 模組數；nn_distance：同 (幣種, 策略) 內的最近鄰對數距離（抽樣）
+    if not modules:
+        return {"distinct_ratio": 0.0, "median_nn_distance": 0.0, "by_stage": {}}
+    groups = {}
+    for mod in modules:
+        groups.setdefault((mod.get("symbol"), mod.get("strategy_type")), []).append(mod)
+    nn, distinct, stage_total, stage_distinct = [], 0, {}, {}
+    for mods in groups.values():
+        logs, cells = _param_matrix(mods)
+        nn.append(nearest_neighbor_distance(logs))
+        distinct += _distinct(cells)
+        stage = np.array([m.get("mutate_stage", "L1") for m in mods])
+        for name in np.unique(stage).tolist():
+            mask = stage == name
+            stage_total[name] = stage_total.get(name, 0) + int(mask.sum())
+            stage_distinct[name] = stage_distinct.get(name, 0) + _distinct(cells[mask])
+    nn = np.concatenate(nn)
+    nn = nn[np.isfinite(nn)]
+    return {
+        "distinct_ratio": round(distinct / len(modules), 4),
+        "median_nn_distance": round(float(np.median(nn)), 5) if len(nn) else 0.0,
+        "min_nn_distance": round(float(nn.min()), 5) if len(nn) else 0.0,
+        "nn_sampled": int(len(nn)),
+        "by_stage": {name: round(stage_distinct[name] / stage_total[name], 4) for name in sorted(stage_total)},
+    }
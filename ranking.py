@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from state_io import atomic_write_json, read_json
+
+# === 排名設定 ===
+LEADERBOARD_PATH = Path("~/Killcore/v5_leaderboard.json").expanduser()
+LEADERBOARD_SIZE = 100
+LEADERBOARD_FIELDS = ("id", "uid", "symbol", "strategy_type", "parameters", "score", "sharpe", "win_rate", "drawdown")
+
+def top_k_indices(scores, k):
+    # argpartition 取前 k，O(n + k log k)；同分時依原順序，與穩定排序（reverse=True）結果一致
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        idx = np.concatenate((above, ties))
+    else:
+        idx = np.arange(n)
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+class Ranking:
+    # 只在需要時才做完整排名；前 k 名走部分選擇
+    def __init__(self, scores):
+        self.scores = np.asarray(scores, dtype=float)
+        self._order = None
+        self._ranks = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def top(self, k):
+        if self._order is not None:
+            return self._order[:k]
+        return top_k_indices(self.scores, k)
+
+    def best(self):
+        return int(np.argmax(self.scores)) if len(self.scores) else None
+
+    def order(self):
+        if self._order is None:
+            self._order = np.lexsort((np.arange(len(self.scores)), -self.scores))
+        return self._order
+
+    def ranks(self):
+        # 1 起算的完整名次（惰性計算）
+        if self._ranks is None:
+            self._ranks = np.empty(len(self.scores), dtype=np.int64)
+            self._ranks[self.order()] = np.arange(1, len(self.scores) + 1)
+        return self._ranks
+
+    def rank_of(self, i):
+        return int(self.ranks()[i])
+
+# === 跨世代排行榜：每代只把本代前 size 名併入 ===
+class Leaderboard:
+    def __init__(self, path=LEADERBOARD_PATH, size=LEADERBOARD_SIZE):
+        self.path = Path(path)
+        self.size = size
+        data = read_json(self.path, default={}) or {}
+        self.entries = data.get("entries", [])
+
+    def min_score(self):
+        return self.entries[-1]["score"] if len(self.entries) >= self.size else float("-inf")
+
+    def merge(self, modules, ranking=None, generation=None):
+        ranking = ranking if ranking is not None else Ranking([m["score"] for m in modules])
+        floor = self.min_score()
+        candidates = [modules[i] for i in ranking.top(self.size).tolist() if modules[i]["score"] > floor]
+        if not candidates:
+            return 0
+        now = datetime.now().isoformat()
+        by_uid = {e.get("uid") or e["id"]: e for e in self.entries}
+        for mod in candidates:
+            entry = {k: mod.get(k) for k in LEADERBOARD_FIELDS}
+            entry["generation"] = generation
+            entry["recorded_at"] = now
+            key = entry["uid"] or entry["id"]
+            if key not in by_uid or by_uid[key]["score"] < entry["score"]:
+                by_uid[key] = entry
+        merged = list(by_uid.values())
+        keep = top_k_indices([e["score"] for e in merged], self.size)
+        self.entries = [merged[i] for i in keep.tolist()]
+        return len(candidates)
+
+    def top(self, n=10):
+        return self.entries[:n]
+
+    def save(self):
+        atomic_write_json(self.path, {"updated_at": datetime.now().isoformat(), "entries": self.entries})
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# === Killcore 狀態檔共用讀寫：暫存檔 + fsync + rename，並以 fcntl 建議鎖協調 ===
+
+def lock_path(path):
+    # 鎖檔集中放在同目錄的 .locks/ 下
+    path = Path(path)
+    return path.parent / ".locks" / (path.name + ".lock")
+
+def file_signature(paths):
+    # (mtime_ns, size) 組成的簽章；只用 stat 判斷檔案是否被別的進程改過
+    sig = []
+    for path in paths:
+        try:
+            st = Path(path).stat()
+            sig.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+@contextmanager
+def file_lock(path, shared=False):
+    # 鎖在獨立的 .lock 檔上，原檔被 rename 取代也不影響
+    lp = lock_path(path)
+    lp.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lp, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path, data, lock=True):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _write():
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        _fsync_dir(path.parent)
+
+    if lock:
+        with file_lock(path):
+            _write()
+    else:
+        _write()
+
+def atomic_write_text(path, text, lock=True):
+    atomic_write_bytes(path, text.encode("utf-8"), lock=lock)
+
+def atomic_write_json(path, data, indent=2, lock=True):
+    atomic_write_text(path, json.dumps(data, indent=indent), lock=lock)
+
+def read_json(path, default=None):
+    path = Path(path)
+    if not path.exists():
+        return default
+    with file_lock(path, shared=True):
+        with path.open() as f:
+            return json.load(f)
+
+@contextmanager
+def locked_append(path):
+    # append-only 檔（log / sidecar）的寫入也需互斥，避免兩個行程交錯寫入半行
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path):
+        with path.open("ab") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
@@ -1,24 +1,20 @@
-import json
+from pathlib import Path
 
-def insert_into_king_pool(v1_path, new_king):
-    with open(v1_path, 'r') as f:
-        king_pool = json.load(f)
-
-    if len(king_pool) < 100:
-        king_pool.append(new_king)
-    else:
-        min_score = min(king_pool, key=lambda x: x["score"])["score"]
-        if new_king["score"] > min_score:
-            king_pool.append(new_king)
-            king_pool = sorted(king_pool, key=lambda x: x["score"], reverse=True)[:100]
-        else:
-            print(f"淘汰：{new_king['id']} 分數 {new_king['score']} 無法進入 v1")
-            return
+from king_pool import get_king_pool
 
-    with open(v1_path, 'w') as f:
-        json.dump(king_pool, f, indent=2)
+def insert_into_king_pool(v1_path, new_king):
+    pool = get_king_pool(Path(v1_path))
+    if not pool.insert(new_king):
+        print(f"淘汰：{new_king['id']} 分數 {new_king['score']} 無法進入 v1")
+        return
     print(f"成功寫入：{new_king['id']}")
 
+def insert_many_into_king_pool(v1_path, new_kings):
+    pool = get_king_pool(Path(v1_path))
+    admitted = pool.insert_many(new_kings)
+    print(f"成功寫入：{len(admitted)} / {len(new_kings)}")
+    return admitted
+
 # 測試用
 if __name__ == "__main__":
     new_king = {
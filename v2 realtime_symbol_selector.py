@@ -1,43 +1,48 @@
 # -*- coding: utf-8 -*-
-import json
 from datetime import datetime
 from pathlib import Path
 
+import market_stream
+from jsonl_log import JsonlLog
+from state_io import atomic_write_json
+
 # === 固定戰鬥幣種 ===
 FIXED_SYMBOLS = ["MATICUSDT", "OPUSDT"]
 OUTPUT_PATH = Path("~/Killcore/v2_candidates.json").expanduser()
-LOG_PATH = Path("~/Killcore/v2_rank_log.json").expanduser()
+LOG_PATH = Path("~/Killcore/v2_rank_log.jsonl").expanduser()
+LEGACY_LOG_PATH = Path("~/Killcore/v2_rank_log.json").expanduser()
 
 ENABLE_LOGGING = True
+ENABLE_STREAMING = True   # replay 目錄存在時改用串流排名
 
 def save_fixed_candidates():
     data = {
         "generated_at": datetime.now().isoformat(),
         "symbols": FIXED_SYMBOLS
     }
-    with OUTPUT_PATH.open("w") as f:
-        json.dump(data, f, indent=2)
+    atomic_write_json(OUTPUT_PATH, data)
     print(f"[v2-lock] 成功選出幣種：{data['symbols']}")
 
-def log_selection():
+def save_stream_candidates():
+    stream, data = market_stream.replay_and_rank()
+    print(f"[v2-stream] 處理 {stream.messages} 筆訊息，選出幣種：{data['symbols']}")
+    return data["symbols"]
+
+def log_selection(symbols=FIXED_SYMBOLS, source="fixed"):
     if not ENABLE_LOGGING:
         return
     log_entry = {
         "timestamp": datetime.now().isoformat(),
-        "source": "fixed",
-        "symbols": FIXED_SYMBOLS
+        "source": source,
+        "symbols": symbols
     }
-    if LOG_PATH.exists():
-        with LOG_PATH.open("r") as f:
-            logs = json.load(f)
-    else:
-        logs = []
-    logs.append(log_entry)
-    with LOG_PATH.open("w") as f:
-        json.dump(logs, f, indent=2)
-    print("[v2-log] 固定幣種已記錄入 log")
+    JsonlLog(LOG_PATH, legacy_path=LEGACY_LOG_PATH).append(log_entry)
+    print(f"[v2-log] {source} 幣種已記錄入 log")
 
 def main():
+    if ENABLE_STREAMING and market_stream.REPLAY_PATH.exists():
+        log_selection(save_stream_candidates(), source="stream")
+        return
     save_fixed_candidates()
     log_selection()
 
@@ -1,8 +1,13 @@
-import json
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
 
+import allocation_engine
+import lineage_store
+import metrics
+from jsonl_log import JsonlLog
+from state_io import atomic_write_json, read_json
+
 # === 開關設定 ===
 ENABLE_SYMBOL_MEMORY = True
 ENABLE_STRATEGY_MAPPING = True
@@ -14,65 +19,72 @@ ENABLE_STRATEGY_COMPATIBILITY_MAP = True
 ENABLE_SYMBOL_CREDIBILITY_SCORER = True
 ENABLE_PREDICTIVE_SIMULATOR = True
 ENABLE_SELECTED_SYMBOL_EXPORT = True  # ← 為 v4 加的
+ENABLE_BANDIT_ALLOCATION = True       # 關閉時退回 allocation_engine.PRIOR_ALLOCATION 固定表
+MODULE_BUDGET = allocation_engine.TOTAL_BUDGET
 
 # === 檔案路徑 ===
 SYMBOL_POOL_PATH = Path("~/Killcore/symbol_pool.json").expanduser()
-SYMBOL_LOG_PATH = Path("~/Killcore/v3_symbol_log.json").expanduser()
+SYMBOL_LOG_PATH = Path("~/Killcore/v3_symbol_log.jsonl").expanduser()
+LEGACY_SYMBOL_LOG_PATH = Path("~/Killcore/v3_symbol_log.json").expanduser()
 LINEAGE_PATH = Path("~/Killcore/v3_lineage.json").expanduser()
 STRATEGY_MAP_PATH = Path("~/Killcore/v3_strategy_map.json").expanduser()
 CREDIBILITY_PATH = Path("~/Killcore/v3_credibility.json").expanduser()
 V4_SELECTED_SYMBOL_PATH = Path("/root/Killcore/v3_selected_symbols.json")
-
-# === 策略建議邏輯（精準版）===
-def recommend_strategies(symbol):
-    if symbol == "MATICUSDT":
-        return ["A", "C"]
-    elif symbol == "OPUSDT":
-        return ["B", "C"]
-    else:
-        return ["C"]
-
-# === 模組分配器（針對雙幣動態調整）===
-def allocate_module_counts(symbol):
-    if symbol == "MATICUSDT":
-        return {
-            "A": 150,
-            "C": 100
-        }
-    elif symbol == "OPUSDT":
-        return {
-            "B": 180,
-            "C": 70
-        }
-    else:
-        return {
-            "C": 100
-        }
+V5_RESULT_PATH = Path("~/Killcore/v5_result.json").expanduser()
+ASSIGNMENT_PATH = Path("~/Killcore/v3_assignments.json").expanduser()
+
+# === 策略建議 + 模組分配（bandit：依 v5 歷史把預算給會出王者的幣種 × 策略）===
+def plan_allocation(symbols, stats=None, seed=None):
+    if not ENABLE_BANDIT_ALLOCATION:
+        return allocation_engine.fixed_allocation(symbols)
+    stats = stats if stats is not None else allocation_engine.AllocationStats()
+    if stats.observe(read_json(V5_RESULT_PATH, default=[]) or []):
+        stats.save()
+        print(f"[v3-L1] 已計入 v5 結果，累計 {stats.rounds} 輪")
+    skipped = sorted(set(symbols) - set(allocation_engine.tradable_symbols(symbols)))
+    if skipped:
+        print(f"[v3-L1] 無 K 線、不分配模組：{skipped}")
+    return allocation_engine.allocate(symbols, stats, budget=MODULE_BUDGET, seed=seed)
+
+def recommend_strategies(symbol, plan):
+    return [s for (sym, s) in plan if sym == symbol]
+
+def allocate_module_counts(symbol, plan):
+    return {s: count for (sym, s), count in plan.items() if sym == symbol}
+
+def build_assignments(symbols, plan):
+    result = []
+    for symbol in symbols:
+        strategies = recommend_strategies(symbol, plan)
+        allocation = allocate_module_counts(symbol, plan)
+        for strat in strategies:
+            count = allocation.get(strat, 0)
+            result.append({
+                "symbol": symbol,
+                "strategy_type": strat,
+                "module_count": count
+            })
+    return result
 
 # === Layer 2 ===
 def build_lineage(symbols):
+    store = lineage_store.get_store()
     lineage = {}
     for sym in symbols:
+        kings = store.kings_for_symbol(sym)
         lineage[sym] = {
-            "ancestors": [],
-            "mutations": [],
-            "king_status": "pending"
+            "ancestors": kings,
+            "mutations": store.recent_mutations(sym),
+            "king_status": "crowned" if kings else "pending"
         }
-    with LINEAGE_PATH.open("w") as f:
-        json.dump(lineage, f, indent=2)
+    atomic_write_json(LINEAGE_PATH, lineage)
     print(f"[v3-L2] 建立族譜完成：{len(lineage)} 幣種")
 
 def log_symbol_history(timestamp, data):
-    log = []
-    if SYMBOL_LOG_PATH.exists():
-        with SYMBOL_LOG_PATH.open("r") as f:
-            log = json.load(f)
-    log.append({
+    JsonlLog(SYMBOL_LOG_PATH, legacy_path=LEGACY_SYMBOL_LOG_PATH).append({
         "timestamp": timestamp,
         "symbols": data
     })
-    with SYMBOL_LOG_PATH.open("w") as f:
-        json.dump(log, f, indent=2)
     print(f"[v3-L2] 歷史記錄完成，共 {len(data)} 策略分配")
 
 def generate_strategy_map(assignments):
@@ -80,63 +92,64 @@ def generate_strategy_map(assignments):
     for entry in assignments:
         mapper[entry["strategy_type"]].add(entry["symbol"])
     out = {k: list(v) for k, v in mapper.items()}
-    with STRATEGY_MAP_PATH.open("w") as f:
-        json.dump(out, f, indent=2)
+    atomic_write_json(STRATEGY_MAP_PATH, out)
     print(f"[v3-L2] 策略-幣適配圖譜完成：{len(out)} 種策略")
 
-def credibility_scoring(symbols):
-    score = {sym: 100 for sym in symbols}
-    with CREDIBILITY_PATH.open("w") as f:
-        json.dump(score, f, indent=2)
-    print(f"[v3-L2] 信譽分已固定設定為 100")
+def credibility_scoring(symbols, stats=None):
+    stats = stats if stats is not None else allocation_engine.AllocationStats()
+    score = stats.credibility(symbols)
+    atomic_write_json(CREDIBILITY_PATH, score)
+    print(f"[v3-L2] 信譽分完成：{score}")
 
 def simulate_predictive_difficulty(symbols):
     for sym in symbols:
         print(f"[v3-L2] 預測模擬：{sym} → 可能陷入低頻橫盤區間")
 
 # === 主流程 ===
-def process_symbol_pool():
+def process_symbol_pool(seed=None):
+    with metrics.run("v3"):
+        return _process_symbol_pool(seed)
+
+def _process_symbol_pool(seed=None):
     if not SYMBOL_POOL_PATH.exists():
         print("[v3] 找不到 symbol_pool.json")
         return []
 
-    with SYMBOL_POOL_PATH.open("r") as f:
-        pool = json.load(f)
+    with metrics.span("read_pool"):
+        pool = read_json(SYMBOL_POOL_PATH)
 
     symbols = pool.get("symbols", [])
-    result = []
-
-    for symbol in symbols:
-        strategies = recommend_strategies(symbol)
-        allocation = allocate_module_counts(symbol)
-        for strat in strategies:
-            count = allocation.get(strat, 0)
-            result.append({
-                "symbol": symbol,
-                "strategy_type": strat,
-                "module_count": count
-            })
+    with metrics.span("allocate"):
+        stats = allocation_engine.AllocationStats()
+        result = build_assignments(symbols, plan_allocation(symbols, stats, seed))
+    metrics.gauge("symbols", len(symbols))
+    metrics.gauge("assignments", len(result))
 
     if ENABLE_SYMBOL_MEMORY:
-        log_symbol_history(pool.get("generated_at", datetime.now().isoformat()), result)
+        with metrics.span("symbol_log"):
+            log_symbol_history(pool.get("generated_at", datetime.now().isoformat()), result)
 
     if ENABLE_MODULE_LINEAGE:
-        build_lineage(symbols)
+        with metrics.span("lineage"):
+            build_lineage(symbols)
 
     if ENABLE_STRATEGY_COMPATIBILITY_MAP:
-        generate_strategy_map(result)
+        with metrics.span("strategy_map"):
+            generate_strategy_map(result)
 
     if ENABLE_SYMBOL_CREDIBILITY_SCORER:
-        credibility_scoring(symbols)
+        with metrics.span("credibility"):
+            credibility_scoring(symbols, stats)
 
     if ENABLE_PREDICTIVE_SIMULATOR:
         simulate_predictive_difficulty(symbols)
 
     if ENABLE_SELECTED_SYMBOL_EXPORT:
         try:
-            with V4_SELECTED_SYMBOL_PATH.open("w") as f:
-                json.dump(symbols, f, indent=2)
-            print(f"[v3-L2] 幣種已輸出供 v4 使用：{symbols}")
+            with metrics.span("export"):
+                atomic_write_json(V4_SELECTED_SYMBOL_PATH, symbols)
+                atomic_write_json(ASSIGNMENT_PATH, {"generated_at": datetime.now().isoformat(), "assignments": result})
+            print(f"[v3-L2] 幣種與模組分配已輸出供 v4 使用：{symbols}")
         except Exception as e:
             print(f"[v3-L2] 幣種輸出失敗：{e}")
 
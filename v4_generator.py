@@ -2,29 +2,63 @@
 import os
 import json
 import random
+import uuid
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+
+import archive_store
+import backtest_engine
+from alias_sampler import AliasSampler
+import generation_store
+import lineage_store
+import metrics
+import param_index
+from king_pool import load_king_pool
+from state_io import atomic_write_json, read_json
+
 MODULE_COUNT = 500
+ENABLE_LEGACY_JSON = False   # 另外輸出舊版 v4_modules/*.json
+ENABLE_LINEAGE_STORE = True  # 族譜寫入 lineage.db（取代逐代複製的 bloodline）
+ENABLE_DEDUP = True          # 參數量化後與本代 / 上一代重複者重抽
+DEDUP_ROUNDS = 5             # 重抽輪數上限；仍重複則保留（預算不縮水）
+ENABLE_DIVERSITY_REPORT = True   # 報表附上多樣性指標（最近鄰距離為抽樣估計）
+ENABLE_ARCHIVE_STORE = True  # 父代池改由 v4_archive.db 索引查詢（取代整檔掃描 v4_archive.json）
 KING_PATH = Path("~/Killcore/king_pool.json").expanduser()
 PREVIOUS_PATH = Path("~/Killcore/v4_archive.json").expanduser()
 SYMBOL_PATH = Path("~/Killcore/v3_selected_symbols.json").expanduser()
+ASSIGNMENT_PATH = Path("~/Killcore/v3_assignments.json").expanduser()
 MODULE_PATH = Path("~/Killcore/v4_modules").expanduser()
 REPORT_PATH = Path("~/Killcore/v4_report.json").expanduser()
 
+# === 預算排程：v3 每個 (symbol, strategy) 的 module_count 依比例拆到 L1 / L2 / L3 ===
+STAGE_RATIOS = {"L1": 0.6, "L2": 0.3, "L3": 0.1}
+STAGE_FALLBACK = {"L1": ("L1",), "L2": ("L2", "L1"), "L3": ("L3", "L2", "L1")}   # 父代池為空時逐層退回
+# 父代池裡沒有該策略時的起始模板
+FALLBACK_TEMPLATES = {
+    "A": {"ma_fast": 10, "ma_slow": 30, "sl_pct": 1.5, "tp_pct": 3.0},
+    "B": {"ma_fast": 15, "ma_slow": 45, "sl_pct": 1.8, "tp_pct": 6.0},
+    "C": {"ma_fast": 5, "ma_slow": 20, "sl_pct": 0.8, "tp_pct": 1.2},
+}
+
 if not MODULE_PATH.exists():
     MODULE_PATH.mkdir(parents=True)
 
 def load_symbols():
-    if SYMBOL_PATH.exists():
-        with open(SYMBOL_PATH) as f:
-            data = json.load(f)
-            if isinstance(data, dict) and "symbols" in data:
-                return data["symbols"]
-            elif isinstance(data, list):
-                return data
+    data = read_json(SYMBOL_PATH)
+    if isinstance(data, dict) and "symbols" in data:
+        return data["symbols"]
+    elif isinstance(data, list):
+        return data
     return ["ETHUSDT", "BTCUSDT"]
 
+def load_assignments():
+    data = read_json(ASSIGNMENT_PATH)
+    if isinstance(data, dict):
+        data = data.get("assignments")
+    return [a for a in data or [] if a.get("module_count", 0) > 0] or None
+
 def mutate_parameters(params, mutation_boost=False, divine_damp=False):
     new_params = {}
     strength_sum = 0
@@ -43,6 +77,120 @@ def mutate_parameters(params, mutation_boost=False, divine_damp=False):
             new_params[k] = v
     return new_params, round(strength_sum / max(1, len(new_params)), 4)
 
+_RNG = np.random.default_rng()
+
+def seed_rng(seed):
+    global _RNG
+    _RNG = np.random.default_rng(seed)
+
+def mutation_bounds(boost, divine):
+    boost = np.asarray(boost, dtype=bool)
+    divine = np.asarray(divine, dtype=bool)
+    low = np.where(divine, 0.98, np.where(boost, 0.85, 0.95))
+    high = np.where(divine, 1.02, np.where(boost, 1.25, 1.05))
+    return low, high
+
+class ParamMatrix:
+    # 父代池參數 → (parents × params) 矩陣；同一池只建一次（重抽時重用）
+    def __init__(self, param_dicts):
+        self.param_dicts = param_dicts
+        first = param_dicts[0] if len(param_dicts) else {}
+        self.keys = tuple(first)
+        kinds = tuple(_param_kind(v) for v in first.values())
+        # 全池參數鍵與型別一致、且都是數值時走純矩陣路徑（實務上恆成立）
+        self.uniform = bool(self.keys) and all(kinds) and all(
+            tuple(p) == self.keys and tuple(_param_kind(v) for v in p.values()) == kinds for p in param_dicts
+        )
+        self.int_cols = np.array([k == 1 for k in kinds], dtype=bool)
+        self.values = np.array([list(p.values()) for p in param_dicts], dtype=float) if self.uniform else None
+
+class ParamRows:
+    # 突變結果：數值矩陣，需要時才一次轉成 dict 清單
+    def __init__(self, keys, int_cols, values):
+        self.keys = keys
+        self.int_cols = int_cols
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.to_dicts([i])[0]
+
+    def to_dicts(self, rows=None):
+        values = self.values if rows is None else self.values[rows]
+        columns = [values[:, c].astype(np.int64).tolist() if is_int else values[:, c].tolist()
+                   for c, is_int in enumerate(self.int_cols)]
+        return [dict(zip(self.keys, vals)) for vals in zip(*columns)]
+
+def as_dicts(params):
+    return params.to_dicts() if isinstance(params, ParamRows) else params
+
+def mutate_parameters_batch(param_dicts, parent_idx, boost, divine):
+    # 一次產生 (modules × parameters) 的突變矩陣；取整 / 四捨五入 / divine_damp / mutation_boost 與 mutate_parameters 相同
+    # param_dicts 可傳 ParamMatrix（重複呼叫時免重建）；回傳 ParamRows（或非數值參數時的 dict 清單）
+    matrix = param_dicts if isinstance(param_dicts, ParamMatrix) else ParamMatrix(param_dicts)
+    parent_idx = np.asarray(parent_idx, dtype=np.int64)
+    n = len(parent_idx)
+    low, high = mutation_bounds(boost, divine)
+    if matrix.uniform:
+        k = len(matrix.keys)
+        factor = _RNG.uniform(low[:, None], high[:, None], size=(n, k))
+        strength = np.abs(factor - 1).sum(axis=1) / k
+        scaled = matrix.values[parent_idx] * factor
+        out = np.where(matrix.int_cols[None, :], np.maximum(1, np.trunc(scaled)), np.round(scaled, 4))
+        return ParamRows(matrix.keys, matrix.int_cols, out), np.round(strength, 4)
+    return _mutate_mixed(matrix.param_dicts, parent_idx, low, high)
+
+def _mutate_mixed(param_dicts, parent_idx, low, high):
+    # 參數鍵 / 型別不一致的池：依組合分組，各組向量化後組回 dict
+    n = len(parent_idx)
+    out = [None] * n
+    strength = np.zeros(n)
+
+    # 依（參數鍵, 型別）組合分組（通常只有一組），每組一次向量化
+    groups = {}
+    for p in np.unique(parent_idx):
+        params = param_dicts[p]
+        sig = (tuple(params), tuple(_param_kind(v) for v in params.values()))
+        groups.setdefault(sig, []).append(p)
+    for (keys, kinds), members in groups.items():
+        members = np.asarray(members)
+        local = np.full(len(param_dicts), -1, dtype=np.int64)
+        local[members] = np.arange(len(members))
+        rows = np.flatnonzero(local[parent_idx] >= 0)
+        src = parent_idx[rows]
+        if not keys:
+            for r in rows:
+                out[r] = {}
+            continue
+
+        values = np.array([[param_dicts[p][k] if kind else 0 for k, kind in zip(keys, kinds)] for p in members],
+                          dtype=float)
+        factor = _RNG.uniform(low[rows, None], high[rows, None], size=(len(rows), len(keys)))
+        strength[rows] = np.abs(factor - 1).sum(axis=1) / len(keys)
+        scaled = values[local[src]] * factor
+
+        columns = []
+        for c, (k, kind) in enumerate(zip(keys, kinds)):
+            if kind == 1:
+                columns.append(np.maximum(1, np.trunc(scaled[:, c])).astype(np.int64).tolist())
+            elif kind == 2:
+                columns.append(np.round(scaled[:, c], 4).tolist())
+            else:
+                columns.append([param_dicts[p][k] for p in src])
+        for r, vals in zip(rows.tolist(), zip(*columns)):
+            out[r] = dict(zip(keys, vals))
+    return out, np.round(strength, 4)
+
+def _param_kind(v):
+    if isinstance(v, int):
+        return 1
+    if isinstance(v, float):
+        return 2
+    return 0
+
+# 找不到 K 線時的後備：隨機績效
 def patch_performance_fields(mod):
     mod["return_pct"] = round(random.uniform(-3, 8), 2)
     mod["adjusted_return_pct"] = round(mod["return_pct"] - random.uniform(0.1, 1.0), 2)
@@ -51,34 +199,38 @@ def patch_performance_fields(mod):
     mod["drawdown"] = round(random.uniform(0.5, 5.0), 1)
     mod["trade_count"] = random.randint(5, 30)
     mod["net_profit"] = round(mod["adjusted_return_pct"] * 10, 2)
+    mod["backtested"] = False   # v5 不讓隨機績效參與封王 / 排行榜 / 父代池
 
 def generate_module(base_mod, generation_index, symbols, stage="L1", boost=False):
-    id_prefix = chr(97 + (generation_index // 50) % 26)
-    new_id = f"{id_prefix}-{generation_index}"
     divine = base_mod.get("is_divine", False)
     params, strength = mutate_parameters(base_mod["parameters"], mutation_boost=boost, divine_damp=divine)
+    return build_module(base_mod, generation_index, random.choice(symbols), params, strength, stage, boost)
 
+def module_template(base_mod):
+    # 只取決於父代的欄位；同一父代的子代共用，逐模組只覆寫自己的欄位（鍵順序不變）
+    divine = base_mod.get("is_divine", False)
     mod = {
-        "id": new_id,
-        "symbol": random.choice(symbols),
+        "id": None,
+        "uid": None,
+        "symbol": None,
         "strategy_type": base_mod["strategy_type"],
-        "parameters": params,
-        "mutation_strength": strength,
-        "mutation_reason": stage if not boost else f"{stage}_resurrected",
+        "parameters": None,
+        "mutation_strength": None,
+        "mutation_reason": None,
         "generation_label": f"G{base_mod.get('mutate_generation', 0)+1}",
         "virtual_capital": 1000.0,
         "parent_id": base_mod.get("id"),
+        "parent_uid": lineage_store.module_uid(base_mod),
         "mutate_generation": base_mod.get("mutate_generation", 0) + 1,
         "from_resurrection": base_mod.get("from_resurrection", False),
         "resurrected": base_mod.get("resurrected", False),
         "resurrection_chance": base_mod.get("resurrection_chance", 0),
-        "bloodline": base_mod.get("bloodline", []) + [base_mod.get("id")],
-        "mutate_stage": stage,
-        "mutate_boost": boost,
+        "mutate_stage": None,
+        "mutate_boost": None,
         "ancestor_god_id": base_mod.get("ancestor_god_id") or (base_mod.get("id") if divine else None),
         "vengeance_mode": base_mod.get("resurrected", False),
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
+        "created_at": None,
+        "updated_at": None,
         "score": base_mod.get("score", 0),
         "sharpe": base_mod.get("sharpe", 0),
         "win_rate": base_mod.get("win_rate", 0),
@@ -100,98 +252,284 @@ def generate_module(base_mod, generation_index, symbols, stage="L1", boost=False
     else:
         mod["blood_mark"] = "neutral"
 
-    patch_performance_fields(mod)
+    return mod
+
+def build_module(base_mod, generation_index, symbol, params, strength, stage="L1", boost=False, template=None,
+                 now=None):
+    id_prefix = chr(97 + (generation_index // 50) % 26)
+    now = now or datetime.now().isoformat()
+    mod = (template or module_template(base_mod)).copy()
+    mod["id"] = f"{id_prefix}-{generation_index}"
+    mod["uid"] = uuid.uuid4().hex
+    mod["symbol"] = symbol
+    mod["parameters"] = params
+    mod["mutation_strength"] = strength
+    mod["mutation_reason"] = stage if not boost else f"{stage}_resurrected"
+    mod["mutate_stage"] = stage
+    mod["mutate_boost"] = boost
+    mod["created_at"] = now
+    mod["updated_at"] = now
     return mod
 
 def load_json_list(path):
-    if path.exists():
-        with path.open() as f:
-            return json.load(f)
-    return []
+    return read_json(path, default=[])
 
 def save_module(mod):
     path = MODULE_PATH / f"{mod['id']}.json"
     with path.open("w") as f:
         json.dump(mod, f, indent=2)
 
-def main():
-    print("[v4] 啟動模組生成（最終完全體 + 報表 + 模擬績效）")
-    king_pool = load_json_list(KING_PATH)
-    previous_modules = load_json_list(PREVIOUS_PATH)
-    symbols = load_symbols()
+def mark_resurrected(mod):
+    mod["from_resurrection"] = True
+    mod["resurrected"] = True
+    mod["resurrection_chance"] = 1.0
+    return mod
 
+def build_parent_pools(king_pool, previous_modules, archive=None):
+    # archive（ArchiveStore）：只查出三個池需要的列；否則線性掃描 previous_modules（evolve 的上一代）
     base_pool_L1, base_pool_L2, base_pool_L3 = [], [], []
     for mod in king_pool:
-        weight = 1 + mod.get("king_rounds", 1)
+        # 權重（1 + king_rounds）由 parent_weights 在抽樣時套用，不再複製參照
         mod["is_divine"] = mod.get("is_divine", False)
-        base_pool_L3.extend([mod] * weight)
+        base_pool_L3.append(mod)
 
+    if archive is not None:
+        resurrect, base_pool_L2, normal = archive.parent_pools()
+        base_pool_L1 = [mark_resurrected(mod) for mod in resurrect] + normal
     for mod in previous_modules:
+        if not backtest_engine.is_backtested(mod):
+            continue
         score = mod.get("score", 0)
         gen = mod.get("mutate_generation", 0)
         if mod.get("eliminated") and score > 75 and len(base_pool_L1) < 100:
-            mod["from_resurrection"] = True
-            mod["resurrected"] = True
-            mod["resurrection_chance"] = 1.0
-            base_pool_L1.append(mod)
+            base_pool_L1.append(mark_resurrected(mod))
         elif score > 85 or gen >= 3:
             base_pool_L2.append(mod)
         elif mod.get("type") != "爆倉型":
             base_pool_L1.append(mod)
 
     if not base_pool_L1:
-        base_pool_L1.append({
-            "id": "fallback_X1",
-            "symbol": "BTCUSDT",
-            "strategy_type": "A",
-            "parameters": {
-                "ma_fast": 10, "ma_slow": 30, "sl_pct": 1.5, "tp_pct": 3.0
-            }
-        })
-
-    print(f"[v4] symbols: {symbols}")
-    print(f"[v4] L1來源: {len(base_pool_L1)} | L2: {len(base_pool_L2)} | L3: {len(base_pool_L3)}")
+        base_pool_L1.append(fallback_template("A"))
+    return base_pool_L1, base_pool_L2, base_pool_L3
+
+def parent_weights(pool, source):
+    # 只有王者池（L3 來源）依在位輪數加權，其餘均勻
+    if source != "L3":
+        return None
+    return [1 + mod.get("king_rounds", 1) for mod in pool]
+
+def fallback_template(strategy_type):
+    return {
+        "id": f"fallback_{strategy_type}1",
+        "symbol": "BTCUSDT",
+        "strategy_type": strategy_type,
+        "parameters": dict(FALLBACK_TEMPLATES.get(strategy_type, FALLBACK_TEMPLATES["A"])),
+    }
+
+def record_lineage(new_modules, parent_pool):
+    parents = {}
+    for mod in parent_pool:
+        parents.setdefault(lineage_store.module_uid(mod), mod)
+    used = {mod["parent_uid"] for mod in new_modules}
+    store = lineage_store.get_store()
+    store.record_roots([parents[uid] for uid in used if uid in parents])
+    store.record_modules(new_modules, parents)
+
+def split_budget(count, ratios=STAGE_RATIOS):
+    # 最大餘數法，保證三階段加總等於 count
+    weights = np.array(list(ratios.values()), dtype=float)
+    exact = weights / weights.sum() * count
+    counts = np.floor(exact).astype(int)
+    rest = count - int(counts.sum())
+    if rest:
+        counts[np.argsort(exact - counts, kind="stable")[::-1][:rest]] += 1
+    return dict(zip(ratios, counts.tolist()))
+
+def schedule_buckets(assignments, ratios=STAGE_RATIOS):
+    # (stage, strategy) → 依序排好的 symbol 清單；同一桶整批抽父代、整批突變
+    buckets = {}
+    for a in assignments:
+        for stage, n in split_budget(int(a["module_count"]), ratios).items():
+            if n:
+                buckets.setdefault((stage, a["strategy_type"]), []).extend([a["symbol"]] * n)
+    order = {stage: i for i, stage in enumerate(ratios)}
+    return sorted(buckets.items(), key=lambda kv: (order[kv[0][0]], kv[0][1]))
+
+def stage_pool(pools, stage, strategy_type):
+    # L3 → L2 → L1 逐層退回，只取同策略的父代；都沒有時用模板
+    for name in STAGE_FALLBACK[stage]:
+        pool = [m for m in pools[name] if m.get("strategy_type") == strategy_type]
+        if pool:
+            return pool, parent_weights(pool, name)
+    return [fallback_template(strategy_type)], None
+
+def generate_stage(pool, start, count, symbols, stage, boost=None, symbol_seq=None, weights=None, index=None):
+    # 整個階段一次抽父代、一次突變；boost=None 時沿用父代的 resurrected
+    # symbol_seq：逐模組指定幣種（預算排程），否則從 symbols 隨機抽
+    # weights：父代權重，建一次 alias 表後整批 O(1) 抽樣
+    # index：ParamIndex，重複的參數組只對那幾列重抽父代 + 重新突變
+    if count <= 0:
+        return []
+    sampler = AliasSampler(weights) if weights is not None else None
+
+    def draw(n):
+        return _RNG.integers(len(pool), size=n) if sampler is None else sampler.draw(_RNG, n)
+
+    pool_params = ParamMatrix([p["parameters"] for p in pool])
+    pool_resurrected = np.array([bool(p.get("resurrected", False)) for p in pool])
+    pool_divine = np.array([bool(p.get("is_divine", False)) for p in pool])
+
+    def mutate(idx):
+        boost_mask = pool_resurrected[idx] if boost is None else np.full(len(idx), bool(boost))
+        params, strength = mutate_parameters_batch(pool_params, idx, boost_mask, pool_divine[idx])
+        return as_dicts(params), strength, boost_mask
+
+    parent_idx = draw(count)
+    params, strength, boost_mask = mutate(parent_idx)
+    if symbol_seq is None:
+        symbol_seq = [symbols[i] for i in _RNG.integers(len(symbols), size=count)]
+    if index is not None:
+        def keys(rows):
+            return [param_index.param_key(symbol_seq[r], pool[parent_idx[r]]["strategy_type"], params[r]) for r in rows]
+
+        dup = index.claim(keys(range(count)))
+        for _ in range(DEDUP_ROUNDS):
+            rows = np.flatnonzero(dup)
+            if not len(rows):
+                break
+            index.resampled += len(rows)
+            parent_idx[rows] = draw(len(rows))
+            new_params, strength[rows], boost_mask[rows] = mutate(parent_idx[rows])
+            for r, p in zip(rows.tolist(), new_params):
+                params[r] = p
+            dup[rows] = index.claim(keys(rows.tolist()))
+        index.kept += int(dup.sum())
+    # 同一父代只建一次模板；整階段共用同一個建立時間
+    now = datetime.now().isoformat()
+    templates = {int(i): module_template(pool[i]) for i in np.unique(parent_idx)}
+    strength = strength.tolist()
+    boost_mask = boost_mask.tolist()
+    return [
+        build_module(pool[i], start + j + 1, symbol_seq[j], params[j], strength[j], stage=stage,
+                     boost=boost_mask[j], template=templates[i], now=now)
+        for j, i in enumerate(parent_idx.tolist())
+    ]
+
+def legacy_stages(pools, module_count=MODULE_COUNT):
+    # 沒有 v3 分配時：整代依比例拆三階段，幣種隨機、不分策略
+    stages = []
+    for stage, n in split_budget(module_count).items():
+        source = next((name for name in STAGE_FALLBACK[stage] if pools[name]), "L1")
+        pool = pools[source]
+        stages.append((stage, pool, parent_weights(pool, source), n, None))
+    return stages
+
+def budget_stages(pools, assignments):
+    stages = []
+    for (stage, strategy_type), seq in schedule_buckets(assignments):
+        pool, weights = stage_pool(pools, stage, strategy_type)
+        stages.append((stage, pool, weights, len(seq), seq))
+    return stages
+
+def generate_generation(king_pool, previous_modules, symbols, verbose=True, assignments=None, archive=None,
+                        backtest=True):
+    # 純記憶體生成一代模組（含回測績效），回傳 (modules, report)
+    # backtest=False：接著會由 v5 以含成本回測覆寫全部績效欄位（evolve），這裡不重複回測
+    with metrics.span("parent_pools"):
+        base_pool_L1, base_pool_L2, base_pool_L3 = build_parent_pools(king_pool, previous_modules, archive)
+    pools = {"L1": base_pool_L1, "L2": base_pool_L2, "L3": base_pool_L3}
+    if verbose:
+        print(f"[v4] symbols: {symbols}")
+        print(f"[v4] L1來源: {len(base_pool_L1)} | L2: {len(base_pool_L2)} | L3: {len(base_pool_L3)}")
 
     report = {"stage_counts": {"L1": 0, "L2": 0, "L3": 0}, "divine": 0, "resurrected": 0, "avg_strength": 0}
     new_modules, total_strength = [], 0
+    index = None
+    if ENABLE_DEDUP:
+        index = param_index.ParamIndex(previous_modules if archive is None else base_pool_L1 + base_pool_L2)
+
+    if assignments:
+        stages = budget_stages(pools, assignments)
+        report["budget"] = sum(int(a["module_count"]) for a in assignments)
+        report["buckets"] = len(stages)
+        if verbose:
+            print(f"[v4] 依 v3 分配生成：{len(assignments)} 組 (symbol, strategy)，共 {report['budget']} 模組")
+    else:
+        stages = legacy_stages(pools)
+    for stage, pool, weights, count, symbol_seq in stages:
+        boost = None if stage == "L1" else True
+        with metrics.span(f"mutate_{stage}"):
+            mods = generate_stage(pool, len(new_modules), count, symbols, stage, boost, symbol_seq, weights, index)
+        if stage == "L3":
+            for mod, score in zip(mods, _RNG.uniform(0.7, 1.0, len(mods))):
+                mod["divine_candidate"] = True
+                mod["divine_score"] = round(float(score), 4)
+        for mod in mods:
+            report["stage_counts"][stage] += 1
+            total_strength += mod["mutation_strength"]
+            if mod["is_divine"]: report["divine"] += 1
+            if stage == "L1" and mod["resurrected"]: report["resurrected"] += 1
+        new_modules.extend(mods)
+
+    metrics.incr("modules_generated", len(new_modules))
+    if ENABLE_DIVERSITY_REPORT:
+        with metrics.span("diversity"):
+            report["diversity"] = param_index.diversity(new_modules)
+    if index is not None:
+        report.setdefault("diversity", {})["dedup"] = index.stats()
+        metrics.incr("dedup_resampled", index.resampled)
+        if verbose:
+            print(f"[v4] 去重：重抽 {index.resampled} 次，仍重複 {index.kept}")
 
-    for i in range(300):
-        parent = random.choice(base_pool_L1)
-        mod = generate_module(parent, i + 1, symbols, stage="L1", boost=parent.get("resurrected", False))
-        save_module(mod)
-        new_modules.append(mod)
-        report["stage_counts"]["L1"] += 1
-        total_strength += mod["mutation_strength"]
-        if mod["is_divine"]: report["divine"] += 1
-        if mod["resurrected"]: report["resurrected"] += 1
-
-    for i in range(300, 450):
-        parent = random.choice(base_pool_L2 if base_pool_L2 else base_pool_L1)
-        mod = generate_module(parent, i + 1, symbols, stage="L2", boost=True)
-        save_module(mod)
-        new_modules.append(mod)
-        report["stage_counts"]["L2"] += 1
-        total_strength += mod["mutation_strength"]
-        if mod["is_divine"]: report["divine"] += 1
-
-    for i in range(450, 500):
-        fallback_pool = base_pool_L3 if base_pool_L3 else (base_pool_L2 if base_pool_L2 else base_pool_L1)
-        parent = random.choice(fallback_pool)
-        mod = generate_module(parent, i + 1, symbols, stage="L3", boost=True)
-        mod["divine_candidate"] = True
-        mod["divine_score"] = round(random.uniform(0.7, 1.0), 4)
-        save_module(mod)
-        new_modules.append(mod)
-        report["stage_counts"]["L3"] += 1
-        total_strength += mod["mutation_strength"]
-        if mod["is_divine"]: report["divine"] += 1
+    if ENABLE_LINEAGE_STORE:
+        with metrics.span("lineage"):
+            record_lineage(new_modules, [m for _, pool, _, _, _ in stages for m in pool])
 
+    if backtest:
+        with metrics.span("backtest"):
+            missing = backtest_engine.evaluate_modules(new_modules)
+    else:
+        missing = backtest_engine.modules_without_candles(new_modules)
+    for mod in missing:
+        patch_performance_fields(mod)
+    if missing and verbose:
+        print(f"[v4] 無 K 線資料，{len(missing)} 模組改用隨機績效（不參與封王）")
+
+    report["backtested"] = len(new_modules) - len(missing) if backtest else 0
+    report["fitness_cache"] = backtest_engine.FITNESS_CACHE.stats()
+    if archive is not None:
+        report["archive"] = archive.stats()
     report["total"] = len(new_modules)
-    report["avg_strength"] = round(total_strength / len(new_modules), 5)
+    report["avg_strength"] = round(total_strength / max(1, len(new_modules)), 5)
     report["generated_at"] = datetime.now().isoformat()
+    return new_modules, report
+
+def save_generation(new_modules, report, generation=None):
+    with metrics.span("save"):
+        generation = generation_store.write_generation(new_modules, generation)
+        if ENABLE_LEGACY_JSON:
+            for mod in new_modules:
+                save_module(mod)
+        report["generation"] = generation
+        atomic_write_json(REPORT_PATH, report)
+    return generation
+
+def main():
+    print("[v4] 啟動模組生成（最終完全體 + 報表 + 模擬績效）")
+    with metrics.run("v4"):
+        with metrics.span("load"):
+            king_pool = load_king_pool(KING_PATH)
+            archive = archive_store.get_store() if ENABLE_ARCHIVE_STORE else None
+            previous_modules = [] if archive is not None else load_json_list(PREVIOUS_PATH)
+            symbols = load_symbols()
+            assignments = load_assignments()
 
-    REPORT_PATH.write_text(json.dumps(report, indent=2))
-    print(f"[v4] 生成完成：{len(new_modules)}，報表寫入 v4_report.json")
+        with metrics.span("generate"):
+            new_modules, report = generate_generation(king_pool, previous_modules, symbols, assignments=assignments,
+                                                      archive=archive)
+        generation = save_generation(new_modules, report)
+    print(f"[v4] 生成完成：{len(new_modules)}（第 {generation} 代），報表寫入 v4_report.json")
+    return new_modules
 
 if __name__ == "__main__":
     main()
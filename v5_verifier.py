@@ -1,147 +1,305 @@
 # -*- coding: utf-8 -*-
-import json
+import os
 import random
+from dataclasses import dataclass, field
 from pathlib import Path
 
+import archive_store
+import backtest_engine
+import generation_store
+import lineage_store
+import metrics
+import parallel_verify
+import walk_forward
+from jsonl_log import JsonlLog
+from state_io import atomic_write_json, read_json
+from king_pool import KingPool
+from ranking import Leaderboard, Ranking
+from indicator_cache import INDICATOR_CACHE
+
 MODULE_PATH = Path("~/Killcore/v4_modules").expanduser()
 RESULT_PATH = Path("~/Killcore/v5_result.json").expanduser()
 KING_PATH = Path("~/Killcore/king_pool.json").expanduser()
-GODLINE_PATH = Path("~/Killcore/godline.json").expanduser()
+GODLINE_PATH = Path("~/Killcore/godline.jsonl").expanduser()
+LEGACY_GODLINE_PATH = Path("~/Killcore/godline.json").expanduser()
+
+ENABLE_PARALLEL_VERIFY = True
+VERIFY_WORKERS = parallel_verify.VERIFY_WORKERS
+RUN_SEED = os.environ.get("KILLCORE_RUN_SEED")   # 未設定時以世代編號為種子
+GODLINE_KEEP = 20
+ENABLE_LINEAGE_STORE = True
+TOP_K = 10                  # 每代只排前 K 名
+ENABLE_FULL_RANKS = False   # 需要每個模組的 score_rank 時才開（整代排序）
+ENABLE_LEADERBOARD = True   # 跨世代排行榜 v5_leaderboard.json
+ENABLE_ARCHIVE = True       # 驗證後的模組寫入 v4_archive.db，供下一次 v4 建父代池
+VERIFY_MODE = os.environ.get("KILLCORE_VERIFY_MODE", "single")   # "walk_forward"：多視窗 + 行情分段樣本外計分
+
+@dataclass
+class VerificationResult:
+    modules: list
+    king: dict
+    prev_divine_id: str = None
+    godslayers: list = field(default_factory=list)
+    top: list = field(default_factory=list)
 
-def simulate_trade(mod):
-    slip = mod.setdefault("slippage_pct", round(random.uniform(-0.003, 0.003), 4))
+def simulate_trade(mod, rng=random):
+    slip = mod.setdefault("slippage_pct", round(rng.uniform(-0.003, 0.003), 4))
     fee = mod.setdefault("tx_fee_pct", 0.001)
     ep = mod.setdefault("entry_price", 1000.0)
     xp = mod.setdefault("exit_price", 1000.0)
 
     entry_adj = ep * (1 + slip)
     exit_adj = xp * (1 - slip)
-    gross_profit = exit_adj - entry_adj
-    net_fee = (entry_adj + exit_adj) * fee
-    net_profit = gross_profit - net_fee
-    return_pct_adj = round((net_profit / entry_adj) * 100, 2) if entry_adj != 0 else 0
     slip_impact = round((xp - exit_adj) / xp * 100, 4)
 
     mod["entry_adj"] = round(entry_adj, 4)
     mod["exit_adj"] = round(exit_adj, 4)
+    mod["slippage_impact_pct"] = slip_impact
+
+    # 已由回測引擎以逐筆交易成本算出 adjusted_return_pct / net_profit
+    if mod.get("backtest_bars"):
+        return
+
+    gross_profit = exit_adj - entry_adj
+    net_fee = (entry_adj + exit_adj) * fee
+    net_profit = gross_profit - net_fee
+    return_pct_adj = round((net_profit / entry_adj) * 100, 2) if entry_adj != 0 else 0
     mod["net_profit"] = round(net_profit, 2)
     mod["adjusted_return_pct"] = return_pct_adj
-    mod["slippage_impact_pct"] = slip_impact
 
-modules = []
-for file in MODULE_PATH.glob("*.json"):
-    with open(file) as f:
-        mod = json.load(f)
-
-        mod.setdefault("return_pct", 0.0)
-        mod.setdefault("sharpe", 0.0)
-        mod.setdefault("win_rate", 0.0)
-        mod.setdefault("drawdown", 0.0)
-        mod.setdefault("entry_delay_sec", random.randint(1, 3))
-        mod.setdefault("type", "unknown")
-        mod.setdefault("fail_count", 0)
-        mod.setdefault("fail_reason", "")
-        mod.setdefault("verified_env", "default")
-        mod.setdefault("resurrected", False)
-        mod.setdefault("is_divine", False)
-        mod.setdefault("divine_rounds", 0)
-        mod.setdefault("simulated_capital_start", 70.51)
-        mod.setdefault("live_rounds", 0)
-        mod.setdefault("capital_curve", [70.51])
-        mod.setdefault("market_type", random.choice(["sideways", "trending", "high_volatility"]))
-        mod.setdefault("funding_plan", "AutoDynamic")
-        mod.setdefault("FRI", round(random.uniform(0.1, 0.9), 3))
-
-        simulate_trade(mod)
-
-        end_capital = mod["simulated_capital_start"] * (1 + mod["adjusted_return_pct"] / 100)
-        mod["simulated_capital_end"] = round(end_capital, 2)
-        mod["capital_curve"].append(mod["simulated_capital_end"])
-
-        modules.append(mod)
-
-for mod in modules:
-    score = round(mod["adjusted_return_pct"] * 0.5 + mod["sharpe"] * 10 + mod["win_rate"] * 0.3 - mod["drawdown"] * 5, 2)
-    mod["score"] = score
-
-modules = sorted(modules, key=lambda x: x["score"], reverse=True)
-for i, mod in enumerate(modules):
-    mod["score_rank"] = i + 1
-    mod["is_king"] = (i == 0)
-    mod["eliminated"] = (i != 0)
-
-top_king = modules[0]
-top_king["king_rounds"] = top_king.get("king_rounds", 0) + 1
-top_king["has_divine_protection"] = True
-
-prev_divine_id = None
-if GODLINE_PATH.exists():
-    with open(GODLINE_PATH) as f:
-        godline = json.load(f)
-        if godline and godline[-1].get("is_divine"):
-            prev_divine_id = godline[-1]["id"]
-
-if prev_divine_id and prev_divine_id != top_king["id"]:
+def load_modules():
+    if generation_store.latest_generation() is not None:
+        return generation_store.read_latest()
+    # 舊版逐模組 JSON
+    loaded = []
+    for file in MODULE_PATH.glob("*.json"):
+        loaded.append(read_json(file))
+    return loaded
+
+def prepare_module(mod, run_seed):
+    rng = parallel_verify.module_rng(mod, run_seed)
+    mod.setdefault("return_pct", 0.0)
+    mod.setdefault("sharpe", 0.0)
+    mod.setdefault("win_rate", 0.0)
+    mod.setdefault("drawdown", 0.0)
+    mod.setdefault("entry_delay_sec", rng.randint(1, 3))
+    mod.setdefault("type", "unknown")
+    mod.setdefault("fail_count", 0)
+    mod.setdefault("fail_reason", "")
+    mod.setdefault("verified_env", "default")
+    mod.setdefault("resurrected", False)
+    mod.setdefault("is_divine", False)
+    mod.setdefault("divine_rounds", 0)
+    mod.setdefault("simulated_capital_start", 70.51)
+    mod.setdefault("live_rounds", 0)
+    mod.setdefault("capital_curve", [70.51])
+    mod.setdefault("market_type", rng.choice(["sideways", "trending", "high_volatility"]))
+    mod.setdefault("funding_plan", "AutoDynamic")
+    mod.setdefault("FRI", round(rng.uniform(0.1, 0.9), 3))
+    mod.setdefault("slippage_pct", round(rng.uniform(-0.003, 0.003), 4))
+    mod.setdefault("tx_fee_pct", 0.001)
+    return mod
+
+def evaluate_generation(modules, workers=VERIFY_WORKERS):
+    # 整代模組批次回測（含滑點與手續費）
+    with metrics.span("backtest"):
+        if ENABLE_PARALLEL_VERIFY:
+            unevaluated = parallel_verify.evaluate_parallel(modules, workers=workers)
+        else:
+            unevaluated = backtest_engine.evaluate_modules(modules, with_costs=True)
+            print(f"[v5] 均線快取：{INDICATOR_CACHE.stats()}")
+            print(f"[v5] 適應度快取：{backtest_engine.FITNESS_CACHE.stats()}")
+    if unevaluated:
+        symbols = sorted({str(m.get("symbol")) for m in unevaluated})
+        print(f"[v5] 無 K 線：{len(unevaluated)} 模組（{', '.join(symbols)}）不參與封王與排行榜")
+
+    wf = VERIFY_MODE == "walk_forward"
+    if wf:
+        with metrics.span("walk_forward"):
+            for mod in modules:
+                mod.pop("wf_score", None)
+            missing = walk_forward.evaluate_walk_forward(modules)
+        if missing:
+            print(f"[v5] walk-forward：{len(missing)} 模組 K 線不足，單次回測計分（未扣樣本外 / 行情懲罰，不參與封王）")
+
+    with metrics.span("simulate_trade"):
+        for mod in modules:
+            simulate_trade(mod)
+
+            end_capital = mod["simulated_capital_start"] * (1 + mod["adjusted_return_pct"] / 100)
+            mod["simulated_capital_end"] = round(end_capital, 2)
+            mod["capital_curve"].append(mod["simulated_capital_end"])
+
+    with metrics.span("score"):
+        for mod in modules:
+            if wf and "wf_score" in mod:
+                mod["score"] = mod["wf_score"]
+                continue
+            score = round(mod["adjusted_return_pct"] * 0.5 + mod["sharpe"] * 10 + mod["win_rate"] * 0.3 - mod["drawdown"] * 5, 2)
+            mod["score"] = score
+
+def rankable(mod):
+    # 只有同一把尺的分數可以同場排名：有回測；walk-forward 模式下還要有 wf_score
+    if not backtest_engine.is_backtested(mod):
+        return False
+    return VERIFY_MODE != "walk_forward" or "wf_score" in mod
+
+def crown_king(modules, godline, top_k=TOP_K):
+    # 只挑前 top_k 名（argpartition），完整名次要 ENABLE_FULL_RANKS 才算；modules 維持原順序
+    # 整代都沒有可比分數時依序退回：有回測者 → 全體（舊版隨機績效模式）
+    eligible = (
+        [i for i, mod in enumerate(modules) if rankable(mod)]
+        or [i for i, mod in enumerate(modules) if backtest_engine.is_backtested(mod)]
+        or list(range(len(modules)))
+    )
+    ranking = Ranking([modules[i]["score"] for i in eligible])
+    top = [eligible[i] for i in ranking.top(top_k).tolist()]
+    king_idx = top[0]
+    for i, mod in enumerate(modules):
+        for stale in ("score_rank", "is_godslayer", "slain_god_id"):
+            mod.pop(stale, None)
+        mod["is_king"] = (i == king_idx)
+        mod["eliminated"] = (i != king_idx)
+    if ENABLE_FULL_RANKS:
+        for i, rank in zip(eligible, ranking.ranks().tolist()):
+            modules[i]["score_rank"] = rank
+    else:
+        for rank, i in enumerate(top, 1):
+            modules[i]["score_rank"] = rank
+
+    top_king = modules[king_idx]
+    top_king["king_rounds"] = top_king.get("king_rounds", 0) + 1
+    top_king["has_divine_protection"] = True
+
+    prev_divine_id = None
+    if godline and godline[-1].get("is_divine"):
+        prev_divine_id = godline[-1]["id"]
+
+    if prev_divine_id and prev_divine_id != top_king["id"]:
+        for mod in modules:
+            if mod["id"] == prev_divine_id:
+                mod.pop("is_divine", None)
+                mod.pop("divine_title", None)
+                mod["was_god"] = True
+                mod["eliminated"] = True
+
+    top_king["is_divine"] = True
+    top_king["divine_title"] = f"True God #{top_king['king_rounds']}"
+    top_king["divine_rounds"] = top_king.get("divine_rounds", 0) + 1
+    top_king["eliminated"] = False
+
+    if prev_divine_id and prev_divine_id != top_king["id"]:
+        top_king["is_godslayer"] = True
+        top_king["slain_god_id"] = prev_divine_id
+
+    return modules, top_king, prev_divine_id, [modules[i] for i in top]
+
+def classify_modules(modules):
+    for mod in modules:
+        if mod["drawdown"] > 25 or mod["net_profit"] < -100:
+            mod["type"] = "explosive"
+            mod["fail_reason"] = "heavy loss"
+        elif mod["sharpe"] < 0.5:
+            mod["fail_reason"] = "low risk control"
+        elif mod["adjusted_return_pct"] < 0:
+            mod["fail_reason"] = "negative return"
+        else:
+            mod["type"] = "stable"
+        if mod.get("fail_count", 0) > 2:
+            mod["score"] -= 5
+            mod["fail_reason"] += " | too many retries"
+
     for mod in modules:
-        if mod["id"] == prev_divine_id:
-            mod.pop("is_divine", None)
-            mod.pop("divine_title", None)
-            mod["was_god"] = True
+        if mod.get("is_divine") and mod.get("king_rounds", 0) > 1:
+            mod["has_divine_protection"] = True
+            mod["eliminated"] = False
+        if not mod.get("is_divine") and not mod.get("is_king"):
             mod["eliminated"] = True
 
-top_king["is_divine"] = True
-top_king["divine_title"] = f"True God #{top_king['king_rounds']}"
-top_king["divine_rounds"] = top_king.get("divine_rounds", 0) + 1
-top_king["eliminated"] = False
+        if not mod["eliminated"]:
+            mod["live_rounds"] = mod.get("live_rounds", 0) + 1
 
-if prev_divine_id and prev_divine_id != top_king["id"]:
-    for mod in modules:
-        if mod["id"] != prev_divine_id and mod["score_rank"] == 1:
-            mod["is_godslayer"] = True
-            mod["slain_god_id"] = prev_divine_id
-
-for mod in modules:
-    if mod["drawdown"] > 25 or mod["net_profit"] < -100:
-        mod["type"] = "explosive"
-        mod["fail_reason"] = "heavy loss"
-    elif mod["sharpe"] < 0.5:
-        mod["fail_reason"] = "low risk control"
-    elif mod["adjusted_return_pct"] < 0:
-        mod["fail_reason"] = "negative return"
-    else:
-        mod["type"] = "stable"
-    if mod.get("fail_count", 0) > 2:
-        mod["score"] -= 5
-        mod["fail_reason"] += " | too many retries"
-
-for mod in modules:
-    if mod.get("is_divine") and mod.get("king_rounds", 0) > 1:
-        mod["has_divine_protection"] = True
-        mod["eliminated"] = False
-    if not mod.get("is_divine") and not mod.get("is_king"):
-        mod["eliminated"] = True
-
-    if not mod["eliminated"]:
-        mod["live_rounds"] = mod.get("live_rounds", 0) + 1
-
-with RESULT_PATH.open("w") as f:
-    json.dump(modules, f, indent=2)
-with KING_PATH.open("w") as f:
-    json.dump([top_king], f, indent=2)
-
-godline_all = []
-if GODLINE_PATH.exists():
-    with open(GODLINE_PATH) as f:
-        godline_all = json.load(f)
-godline_all.append(top_king)
-with GODLINE_PATH.open("w") as f:
-    json.dump(godline_all[-20:], f, indent=2)
-
-print(f"[v5] New King: {top_king['id']} (Score: {top_king['score']})")
-if top_king.get("is_divine"):
-    print(f"[v5] True God: {top_king['divine_title']} (Rounds: {top_king['divine_rounds']})")
-if top_king.get("king_rounds", 0) > 1:
-    print(f"[v5] Consecutive Reign: {top_king['king_rounds']} rounds")
-for mod in modules:
-    if mod.get("is_godslayer"):
+def record_lineage(modules, top_king, godline):
+    store = lineage_store.get_store()
+    store.record_verification(modules)
+    # 新王是否為前任真神的後裔
+    if godline:
+        prev_god_uid = lineage_store.module_uid(godline[-1])
+        top_king["heir_of_god"] = store.is_descendant(lineage_store.module_uid(top_king), prev_god_uid)
+
+def verify_generation(modules, *, king_pool, godline, run_seed=0, workers=VERIFY_WORKERS,
+                      leaderboard=None, generation=None) -> VerificationResult:
+    # 記憶體內驗證：更新 king_pool（KingPool）、godline（list）與 leaderboard；
+    # 唯一的落地是 ENABLE_LINEAGE_STORE 時寫入 lineage.db（分數 / 王者旗標），其餘檔案由呼叫端存
+    with metrics.span("prepare"):
+        for mod in modules:
+            prepare_module(mod, run_seed)
+    evaluate_generation(modules, workers=workers)
+    with metrics.span("crown"):
+        modules, top_king, prev_divine_id, top = crown_king(modules, godline)
+    with metrics.span("classify"):
+        classify_modules(modules)
+    if leaderboard is not None:
+        with metrics.span("leaderboard"):
+            leaderboard.merge([m for m in modules if rankable(m)], generation=generation)
+    metrics.incr("modules_verified", len(modules))
+
+    if ENABLE_LINEAGE_STORE:
+        with metrics.span("lineage"):
+            record_lineage(modules, top_king, godline)
+
+    king_pool.reset([top_king])
+    godline.append(top_king)
+    del godline[:-GODLINE_KEEP]
+
+    godslayers = [top_king] if top_king.get("is_godslayer") else []
+    return VerificationResult(modules, top_king, prev_divine_id, godslayers, top)
+
+def godline_log(path=GODLINE_PATH):
+    return JsonlLog(path, legacy_path=LEGACY_GODLINE_PATH)
+
+def load_godline(path=GODLINE_PATH):
+    # 只讀檔尾最近 GODLINE_KEEP 筆
+    return godline_log(path).tail(GODLINE_KEEP)
+
+def report(result):
+    top_king = result.king
+    print(f"[v5] New King: {top_king['id']} (Score: {top_king['score']})")
+    if top_king.get("is_divine"):
+        print(f"[v5] True God: {top_king['divine_title']} (Rounds: {top_king['divine_rounds']})")
+    if top_king.get("king_rounds", 0) > 1:
+        print(f"[v5] Consecutive Reign: {top_king['king_rounds']} rounds")
+    for mod in result.godslayers:
         print(f"[v5] Godslayer: {mod['id']} (Killed: {mod['slain_god_id']})")
+
+def main():
+    with metrics.run("v5"):
+        generation = generation_store.latest_generation()
+        run_seed = RUN_SEED if RUN_SEED is not None else generation or 0
+        with metrics.span("load"):
+            king_pool = KingPool(KING_PATH)
+            godline = load_godline()
+            leaderboard = Leaderboard() if ENABLE_LEADERBOARD else None
+            modules = load_modules()
+
+        with metrics.span("verify"):
+            result = verify_generation(modules, king_pool=king_pool, godline=godline, run_seed=run_seed,
+                                       leaderboard=leaderboard, generation=generation)
+
+        with metrics.span("write_result"):
+            atomic_write_json(RESULT_PATH, result.modules)
+            if leaderboard is not None:
+                leaderboard.save()
+        if ENABLE_ARCHIVE:
+            with metrics.span("archive"):
+                archive_store.get_store().append(result.modules, generation=generation)
+        with metrics.span("king_pool_compact"):
+            king_pool.compact()
+        with metrics.span("godline_append"):
+            godline_log().append(result.king)
+
+    report(result)
+    return result
+
+if __name__ == "__main__":
+    main()
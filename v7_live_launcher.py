@@ -1,7 +1,12 @@
-import json
+import argparse
+import asyncio
 from pathlib import Path
 from datetime import datetime
 
+from king_pool import load_king_pool
+from market_stream import REPLAY_PATH, FileReplaySource
+from paper_trader import KingWatcher, PaperTrader, StubExchangeFeed
+
 KING_PATH = Path("~/Killcore/king_pool.json").expanduser()
 
 def format_percent(v):
@@ -64,17 +69,51 @@ def strategy_label(s):
         "C": "穩定 scalping"
     }.get(s, "未知")
 
+# === 模擬實盤 ===
+def show_paper_report(report):
+    lat = report["latency"]
+    print(f"[v7] 模擬實盤結束：{report['ticks']} 筆行情，{report['trades']} 筆交易，"
+          f"資金 {report['capital']}{'（持倉中）' if report['in_position'] else ''}")
+    print(f"[v7] tick→決策延遲 p50 {lat['p50_us']}µs / p99 {lat['p99_us']}µs / max {lat['max_us']}µs")
+    if report["swaps"]:
+        print(f"[v7] 期間王者替換 {report['swaps']} 次（最終：{report['king_id']}）")
+
+def run_paper(king, replay=None, stub_ticks=0, max_messages=None, seed=None, watch=False, delay=0.0):
+    if stub_ticks:
+        source = StubExchangeFeed(king.get("symbol"), ticks=stub_ticks, seed=seed, delay=delay)
+    else:
+        # 監看模式保留所有幣種的收盤價，新王換幣種時也不必冷啟動
+        symbols = None if watch else [king.get("symbol")]
+        source = FileReplaySource(replay or REPLAY_PATH, symbols=symbols, delay=delay)
+    trader = PaperTrader(king)
+    watcher = KingWatcher(KING_PATH) if watch else None
+    report = asyncio.run(trader.run(source, max_messages=max_messages, watcher=watcher))
+    show_paper_report(report)
+    return trader
+
 # === 主執行 ===
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Killcore v7 王者簡報 / 模擬實盤")
+    parser.add_argument("--paper", action="store_true", help="以王者參數跑模擬實盤（預設重播 ~/Killcore/replay）")
+    parser.add_argument("--replay", type=Path, default=None)
+    parser.add_argument("--stub", type=int, default=0, metavar="N", help="改用 N 筆假成交資料源")
+    parser.add_argument("--max-messages", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--watch", action="store_true", help="監看 king_pool / godline，新王加冕時不重啟直接換參數")
+    parser.add_argument("--delay", type=float, default=0.0, help="每筆行情間隔秒數（重播 / 假資料源）")
+    args = parser.parse_args()
+
     if not KING_PATH.exists():
         print("[v7] 找不到王者資料 king_pool.json")
         exit(1)
 
-    with KING_PATH.open() as f:
-        data = json.load(f)
-        if not data:
-            print("[v7] 王者資料為空")
-            exit(1)
+    data = load_king_pool(KING_PATH)
+    if not data:
+        print("[v7] 王者資料為空")
+        exit(1)
+
+    king = data[0]
+    show_king_report(king)
 
-        king = data[0]
-        show_king_report(king)
+    if args.paper:
+        run_paper(king, args.replay, args.stub, args.max_messages, args.seed, args.watch, args.delay)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import backtest_engine
+from backtest_engine import BARS_PER_YEAR, CLOSE
+
+# === Walk-forward 設定 ===
+WF_WINDOWS = 20          # 樣本外（OOS）視窗數
+WF_TRAIN_STEPS = 3       # 每個樣本內（IS）區段 = WF_TRAIN_STEPS 個 OOS 長度
+MIN_WINDOW_BARS = 24
+OOS_PENALTY = 0.5        # IS → OOS Sharpe 衰退的扣分權重
+REGIME_PENALTY = 0.5     # 最差行情 Sharpe 為負時的扣分權重
+
+# === 行情分段（以真實 K 線標記，取代隨機 market_type）===
+REGIMES = ("sideways", "trending", "high_volatility")
+REGIME_BARS = 96         # 滾動視窗
+VOL_QUANTILE = 0.75      # 波動高於此分位 → high_volatility
+TREND_QUANTILE = 0.6     # 其餘趨勢強度高於此分位 → trending
+MIN_REGIME_BARS = 48     # 該行情樣本太少時不計入最差行情
+
+def walk_forward_windows(n_bar, windows=WF_WINDOWS, train_steps=WF_TRAIN_STEPS):
+    # 回傳 (is_start, is_end, oos_start, oos_end)，每個 OOS 緊接在自己的 IS 之後，視窗等長、依序前移
+    step = n_bar // (windows + train_steps)
+    if step < MIN_WINDOW_BARS:
+        windows = max(1, n_bar // MIN_WINDOW_BARS - train_steps)
+        step = n_bar // (windows + train_steps)
+    if step < 2:
+        return None
+    offset = n_bar - (windows + train_steps) * step   # 視窗對齊到最新 K 線
+    is_start = offset + np.arange(windows) * step
+    is_end = is_start + train_steps * step
+    return is_start, is_end, is_end, is_end + step
+
+def label_regimes(ohlcv, bars=REGIME_BARS):
+    # 0 = sideways, 1 = trending, 2 = high_volatility（對應 REGIMES）
+    close = ohlcv[:, CLOSE]
+    n = len(close)
+    r = np.zeros(n)
+    r[1:] = np.log(close[1:] / close[:-1])
+    c1 = np.concatenate(([0.0], np.cumsum(r)))
+    c2 = np.concatenate(([0.0], np.cumsum(r * r)))
+    t = np.arange(n)
+    lo = np.maximum(t + 1 - bars, 0)
+    k = (t + 1 - lo).astype(float)
+    mean = (c1[t + 1] - c1[lo]) / k
+    vol = np.sqrt(np.maximum((c2[t + 1] - c2[lo]) / k - mean * mean, 0.0))
+    trend = np.abs(c1[t + 1] - c1[lo])
+
+    labels = np.zeros(n, dtype=np.int8)
+    high_vol = vol >= np.quantile(vol, VOL_QUANTILE)
+    rest = ~high_vol
+    if rest.any():
+        labels[rest & (trend >= np.quantile(trend[rest], TREND_QUANTILE))] = 1
+    labels[high_vol] = 2
+    return labels
+
+# === (modules × windows) 區段統計：累積和相減，一次算完所有視窗 ===
+def _sharpe(s1, s2, k):
+    mean = s1 / k
+    std = np.sqrt(np.maximum(s2 / k - mean * mean, 0.0))
+    return np.divide(mean, std, out=np.zeros_like(mean), where=std > 1e-12) * np.sqrt(BARS_PER_YEAR)
+
+def segment_stats(net, entries, starts, ends, with_drawdown=False):
+    n_mod = net.shape[0]
+    zero = np.zeros((n_mod, 1))
+    log_eq = np.concatenate((zero, np.cumsum(np.log1p(net), axis=1)), axis=1)
+    c1 = np.concatenate((zero, np.cumsum(net, axis=1)), axis=1)
+    c2 = np.concatenate((zero, np.cumsum(net * net, axis=1)), axis=1)
+    ce = np.concatenate((zero, np.cumsum(entries, axis=1)), axis=1)
+    k = (ends - starts).astype(float)
+
+    stats = {
+        "return_pct": (np.exp(log_eq[:, ends] - log_eq[:, starts]) - 1) * 100,
+        "sharpe": _sharpe(c1[:, ends] - c1[:, starts], c2[:, ends] - c2[:, starts], k[None, :]),
+        "trades": ce[:, ends] - ce[:, starts],
+    }
+    if with_drawdown:
+        # 視窗等長：以索引網格一次取出 (modules × windows × bars) 的權益曲線
+        length = int(k[0])
+        grid = starts[:, None] + np.arange(1, length + 1)[None, :]
+        eq = np.exp(log_eq[:, grid] - log_eq[:, starts][:, :, None])
+        peak = np.maximum(np.maximum.accumulate(eq, axis=2), 1.0)
+        stats["drawdown"] = (1 - eq / peak).max(axis=2) * 100
+    return stats
+
+def regime_sharpe(net, labels):
+    # 每種行情一個遮罩，矩陣乘法一次得到 (modules × regimes)
+    masks = np.stack([labels == i for i in range(len(REGIMES))], axis=1).astype(float)
+    counts = masks.sum(axis=0)
+    s1 = net @ masks
+    s2 = (net * net) @ masks
+    sharpe = _sharpe(s1, s2, np.maximum(counts, 1.0)[None, :])
+    return sharpe, counts
+
+def walk_forward_batch(ohlcv, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct=0.0, slippage_pct=0.0,
+                       cache_key=None):
+    n_bar = len(ohlcv)
+    bounds = walk_forward_windows(n_bar)
+    if bounds is None:
+        return None
+    pos, held, _, net = backtest_engine.position_returns(
+        ohlcv, strategy_types, ma_fast, ma_slow, sl_pct, tp_pct, fee_pct, slippage_pct, cache_key
+    )
+    entries = pos & ~held
+    is_start, is_end, oos_start, oos_end = bounds
+    ins = segment_stats(net, entries, is_start, is_end)
+    oos = segment_stats(net, entries, oos_start, oos_end, with_drawdown=True)
+
+    labels = label_regimes(ohlcv)
+    r_sharpe, r_counts = regime_sharpe(net, labels)
+    valid = r_counts >= MIN_REGIME_BARS
+    worst = r_sharpe[:, valid].min(axis=1) if valid.any() else np.zeros(len(net))
+
+    oos_return = oos["return_pct"].mean(axis=1)
+    oos_sharpe = oos["sharpe"].mean(axis=1)
+    consistency = (oos["return_pct"] > 0).mean(axis=1) * 100
+    oos_drawdown = oos["drawdown"].max(axis=1)
+    decay = np.maximum(ins["sharpe"] - oos["sharpe"], 0.0).mean(axis=1)
+
+    # 與單次回測同一計分公式，只是全部換成樣本外數字，再扣 IS→OOS 衰退與最差行情
+    score = (oos_return * 0.5 + oos_sharpe * 10 + consistency * 0.3 - oos_drawdown * 5
+             - OOS_PENALTY * decay * 10 - REGIME_PENALTY * np.maximum(-worst, 0.0) * 10)
+    return {
+        "windows": len(is_start),
+        "oos_return_pct": oos_return,
+        "oos_sharpe": oos_sharpe,
+        "oos_consistency": consistency,
+        "oos_drawdown": oos_drawdown,
+        "oos_trades": oos["trades"].sum(axis=1),
+        "is_sharpe": ins["sharpe"].mean(axis=1),
+        "sharpe_decay": decay,
+        "regime_sharpe": r_sharpe,
+        "worst_regime_sharpe": worst,
+        "current_regime": REGIMES[int(labels[-1])],
+        "score": score,
+    }
+
+def evaluate_walk_forward(modules, timeframe=backtest_engine.TIMEFRAME, with_costs=True):
+    # 依幣種分組批次計算，結果寫回模組；回傳沒有足夠 K 線的模組
+    groups = {}
+    for mod in modules:
+        groups.setdefault(mod.get("symbol"), []).append(mod)
+
+    missing = []
+    for symbol, mods in groups.items():
+        ohlcv = backtest_engine.load_candles(symbol, timeframe)
+        if ohlcv is None or len(ohlcv) < 2 or walk_forward_windows(len(ohlcv)) is None:
+            missing.extend(mods)
+            continue
+        # 依 backtest_engine.CHUNK_ELEMS 分塊，(modules × bars) 矩陣只在塊內存在
+        for lo, hi in backtest_engine.chunk_bounds(len(mods), len(ohlcv)):
+            _evaluate_chunk(mods[lo:hi], ohlcv, symbol, timeframe, with_costs)
+    return missing
+
+def _evaluate_chunk(mods, ohlcv, symbol, timeframe, with_costs):
+    fee = [m.get("tx_fee_pct", 0.001) for m in mods] if with_costs else 0.0
+    slip = [m.get("slippage_pct", 0.0) for m in mods] if with_costs else 0.0
+    res = walk_forward_batch(ohlcv, *backtest_engine._param_columns(mods), fee_pct=fee, slippage_pct=slip,
+                             cache_key=(symbol, timeframe))
+    for i, mod in enumerate(mods):
+        mod["market_type"] = res["current_regime"]
+        mod["walk_forward"] = {
+            "windows": res["windows"],
+            "oos_return_pct": round(float(res["oos_return_pct"][i]), 2),
+            "oos_sharpe": round(float(res["oos_sharpe"][i]), 2),
+            "oos_consistency": round(float(res["oos_consistency"][i]), 1),
+            "oos_drawdown": round(float(res["oos_drawdown"][i]), 1),
+            "oos_trades": int(res["oos_trades"][i]),
+            "is_sharpe": round(float(res["is_sharpe"][i]), 2),
+            "sharpe_decay": round(float(res["sharpe_decay"][i]), 2),
+            "regime_sharpe": {r: round(float(v), 2) for r, v in zip(REGIMES, res["regime_sharpe"][i])},
+            "worst_regime_sharpe": round(float(res["worst_regime_sharpe"][i]), 2),
+        }
+        mod["wf_score"] = round(float(res["score"][i]), 2)